@@ -0,0 +1,411 @@
+from sqlalchemy import select, delete
+from sqlalchemy.engine import Engine
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from datetime import datetime, timedelta
+from urllib.parse import quote, unquote
+import argparse
+import asyncio
+import logging
+import os
+import time
+import numpy as np
+from .config import settings
+from .database import HealthData, engine
+from .hot_cache import hot_cache
+from .metrics import Counter, Histogram
+from .refresh_tokens import purge_refresh_tokens
+
+logger = logging.getLogger(__name__)
+
+# Column layout of an archive file; nullable floats are stored as NaN and
+# a missing activity level as an empty string
+TIME_COLUMNS = ('timestamp', 'created_at')
+FLOAT_COLUMNS = ('heart_rate', 'blood_oxygen')
+NULLABLE_COLUMNS = ('temperature', 'blood_pressure_systolic', 'blood_pressure_diastolic', 'anomaly_score')
+
+archived_readings_counter = Counter(
+    "lifecare_archived_readings_total",
+    "Readings moved from health_data into the archive"
+)
+retention_latency_histogram = Histogram(
+    "lifecare_retention_run_seconds",
+    "Duration of one retention pass",
+    buckets=[0.01, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0, 600.0]
+)
+
+def _month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def _next_month(month: datetime) -> datetime:
+    return (month + timedelta(days=32)).replace(day=1)
+
+def _to_columns(rows: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    columns = {
+        'id': np.array([row['id'] for row in rows], dtype=np.int64),
+        'is_anomaly': np.array([bool(row['is_anomaly']) for row in rows], dtype=bool)
+    }
+    for name in TIME_COLUMNS:
+        columns[name] = np.array([row[name] for row in rows], dtype='datetime64[us]')
+    for name in FLOAT_COLUMNS + NULLABLE_COLUMNS:
+        columns[name] = np.array([np.nan if row[name] is None else row[name] for row in rows], dtype=np.float64)
+    columns['activity_level'] = np.array([row['activity_level'] or '' for row in rows], dtype=str)
+    return columns
+
+def _sorted_unique(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Columns sorted by (timestamp, id) with duplicate ids dropped"""
+    _, unique = np.unique(columns['id'], return_index=True)
+    order = unique[np.lexsort((columns['id'][unique], columns['timestamp'][unique]))]
+    return {name: values[order] for name, values in columns.items()}
+
+def _write_npz(path: str, columns: Dict[str, np.ndarray]):
+    with open(path, "wb") as f:
+        np.savez_compressed(f, **columns)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _to_rows(user_id: str, columns: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    lists = {name: values.tolist() for name, values in columns.items()}
+    for name in NULLABLE_COLUMNS:
+        lists[name] = [None if value != value else value for value in lists[name]]
+    lists['activity_level'] = [value or None for value in lists['activity_level']]
+    return [
+        {'user_id': user_id, **{name: values[i] for name, values in lists.items()}}
+        for i in range(len(lists['id']))
+    ]
+
+class StagedPart(NamedTuple):
+    tmp_path: str
+    path: str
+
+class ReadingArchive:
+    """Compressed columnar store for readings that have aged out of health_data.
+    
+    Each archived chunk of a user's month is written once as its own part
+    file (YYYY-MM.<first id>.npz) and never rewritten; compact() later merges
+    a month's parts into YYYY-MM.npz. Reads union a month's files, sorted by
+    (timestamp, id) and deduplicated by id, so re-archiving a chunk after a
+    crash is safe.
+    
+    The archive only ever holds readings older than retention_days (when
+    retention is enabled), which lets callers skip it for recent ranges.
+    """
+    
+    def __init__(self, root: str, retention_days: int = 0):
+        self.root = root
+        self.retention_days = retention_days
+    
+    def _user_dir(self, user_id: str) -> str:
+        return os.path.join(self.root, quote(user_id, safe=''))
+    
+    def path(self, user_id: str, month: datetime, first_id: Optional[int] = None) -> str:
+        name = f"{month:%Y-%m}.npz" if first_id is None else f"{month:%Y-%m}.{first_id:012d}.npz"
+        return os.path.join(self._user_dir(user_id), name)
+    
+    def _files(self, user_id: str) -> List[str]:
+        try:
+            return [name for name in os.listdir(self._user_dir(user_id)) if name.endswith(".npz")]
+        except FileNotFoundError:
+            return []
+    
+    def parts(self, user_id: str, month: datetime) -> List[str]:
+        prefix = f"{month:%Y-%m}."
+        return sorted(
+            os.path.join(self._user_dir(user_id), name)
+            for name in self._files(user_id) if name.startswith(prefix)
+        )
+    
+    def months(self, user_id: str) -> List[datetime]:
+        """Months archived for a user, oldest first"""
+        return sorted({datetime.strptime(name[:7], "%Y-%m") for name in self._files(user_id)})
+    
+    def users(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return [unquote(name) for name in os.listdir(self.root)]
+    
+    def may_contain(self, start: datetime) -> bool:
+        """False when [start, ...) is newer than anything retention archives"""
+        if self.retention_days <= 0:
+            # Retention is off, but an archive left from when it was on still counts
+            return os.path.isdir(self.root)
+        return start < datetime.utcnow() - timedelta(days=self.retention_days)
+    
+    def load(self, user_id: str, month: datetime) -> Optional[Dict[str, np.ndarray]]:
+        while True:
+            paths = self.parts(user_id, month)
+            if not paths:
+                return None
+            try:
+                chunks = []
+                for path in paths:
+                    with np.load(path, allow_pickle=False) as data:
+                        chunks.append({name: data[name] for name in data.files})
+            except FileNotFoundError:
+                # A compaction removed a part after it was listed; list again
+                continue
+            if len(chunks) == 1:
+                return chunks[0]
+            return _sorted_unique({name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]})
+    
+    def stage(self, user_id: str, month: datetime, rows: List[Dict[str, Any]]) -> StagedPart:
+        """Write rows as a new part under a temporary name; publish() makes it visible"""
+        columns = _sorted_unique(_to_columns(rows))
+        path = self.path(user_id, month, int(columns['id'].min()))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        _write_npz(tmp_path, columns)
+        return StagedPart(tmp_path, path)
+    
+    def publish(self, staged: Sequence[StagedPart]):
+        for part in staged:
+            os.replace(part.tmp_path, part.path)
+    
+    def discard(self, staged: Sequence[StagedPart]):
+        """Remove staged parts, published or not"""
+        for part in staged:
+            for path in (part.tmp_path, part.path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+    
+    def compact(self, user_id: str, month: datetime):
+        """Merge a month's part files into YYYY-MM.npz"""
+        paths = self.parts(user_id, month)
+        if len(paths) < 2:
+            return
+        columns = self.load(user_id, month)
+        path = self.path(user_id, month)
+        tmp_path = f"{path}.tmp"
+        _write_npz(tmp_path, columns)
+        # The merged file lands before the parts go, so readers never miss a row
+        os.replace(tmp_path, path)
+        for part_path in paths:
+            if part_path != path:
+                os.remove(part_path)
+    
+    def _range(self, user_id: str, start: datetime, end: Optional[datetime]) -> Iterator[Dict[str, np.ndarray]]:
+        """Columns of the archived readings in [start, end), one month at a time"""
+        lo = np.datetime64(start, 'us')
+        hi = np.datetime64(end, 'us') if end is not None else None
+        for month in self.months(user_id):
+            if _next_month(month) <= start or (end is not None and month >= end):
+                continue
+            columns = self.load(user_id, month)
+            if columns is None:
+                continue
+            mask = columns['timestamp'] >= lo
+            if hi is not None:
+                mask &= columns['timestamp'] < hi
+            if mask.any():
+                yield {name: values[mask] for name, values in columns.items()}
+    
+    def aggregate(self, user_id: str, start: datetime, end: Optional[datetime] = None) -> Tuple:
+        """Summary of archived readings in [start, end), in rollups.Aggregate field order"""
+        chunks = list(self._range(user_id, start, end))
+        if not chunks:
+            return (0,)
+        hr = np.concatenate([columns['heart_rate'] for columns in chunks])
+        spo2 = np.concatenate([columns['blood_oxygen'] for columns in chunks])
+        anomalies = sum(int(columns['is_anomaly'].sum()) for columns in chunks)
+        last_timestamp = max(columns['timestamp'].max() for columns in chunks).tolist()
+        return (len(hr), anomalies, float(hr.sum()), float(np.dot(hr, hr)), float(hr.min()), float(hr.max()),
+                float(spo2.sum()), float(np.dot(spo2, spo2)), float(spo2.min()), float(spo2.max()), last_timestamp)
+    
+    def series(self, user_id: str, column: str, start: datetime, end: datetime) -> Tuple[np.ndarray, np.ndarray]:
+        """Timestamps and values of one column of the archived readings in [start, end)"""
+        chunks = list(self._range(user_id, start, end))
+        if not chunks:
+            return np.empty(0, dtype='datetime64[us]'), np.empty(0)
+        return (np.concatenate([columns['timestamp'] for columns in chunks]),
+                np.concatenate([columns[column] for columns in chunks]))
+    
+    def rows(self, user_id: str) -> Iterator[List[Dict[str, Any]]]:
+        """Every archived reading of a user as health_data rows, one month at a time"""
+        for month in self.months(user_id):
+            columns = self.load(user_id, month)
+            if columns is not None:
+                yield _to_rows(user_id, columns)
+    
+    def page(
+        self,
+        user_id: str,
+        before: Optional[Tuple[datetime, int]],
+        skip: int,
+        limit: int
+    ) -> List[HealthData]:
+        """Archived readings newest first, strictly after the (timestamp, id) position"""
+        wanted = skip + limit
+        rows: List[Dict[str, Any]] = []
+        for month in reversed(self.months(user_id)):
+            if before is not None and month > before[0]:
+                continue
+            columns = self.load(user_id, month)
+            if columns is None:
+                continue
+            if before is not None:
+                ts = np.datetime64(before[0], 'us')
+                mask = (columns['timestamp'] < ts) | ((columns['timestamp'] == ts) & (columns['id'] < before[1]))
+                columns = {name: values[mask] for name, values in columns.items()}
+            # Files are sorted ascending, so the newest rows are at the end
+            take = wanted - len(rows)
+            columns = {name: values[::-1][:take] for name, values in columns.items()}
+            rows.extend(_to_rows(user_id, columns))
+            if len(rows) >= wanted:
+                break
+        return [HealthData(**row) for row in rows[skip:wanted]]
+
+reading_archive = ReadingArchive(settings.ARCHIVE_DIR, settings.RETENTION_DAYS)
+
+def archive_user_readings(
+    engine: Engine,
+    user_id: str,
+    cutoff: datetime,
+    chunk_rows: int,
+    batch_size: int,
+    max_parts: int = 32
+) -> int:
+    """Move one user's readings older than cutoff into the archive, returning how many moved"""
+    columns = [getattr(HealthData, column.name) for column in HealthData.__table__.columns]
+    moved = 0
+    touched = set()
+    while True:
+        # Read a chunk oldest first through the (user_id, timestamp) index
+        with engine.connect() as conn:
+            rows = [dict(row._mapping) for row in conn.execute(
+                select(*columns).where(
+                    HealthData.user_id == user_id,
+                    HealthData.timestamp < cutoff
+                ).order_by(HealthData.timestamp, HealthData.id).limit(chunk_rows)
+            )]
+        if not rows:
+            break
+        
+        by_month: Dict[datetime, List[Dict[str, Any]]] = {}
+        for row in rows:
+            by_month.setdefault(_month_start(row['timestamp']), []).append(row)
+        staged = [reading_archive.stage(user_id, month, month_rows) for month, month_rows in by_month.items()]
+        
+        # Delete the chunk and publish its parts in one transaction, publishing
+        # last, so no reader sees a reading both in health_data and the archive
+        ids = [row['id'] for row in rows]
+        try:
+            with engine.begin() as conn:
+                for i in range(0, len(ids), batch_size):
+                    conn.execute(delete(HealthData).where(HealthData.id.in_(ids[i:i + batch_size])))
+                reading_archive.publish(staged)
+        except Exception:
+            reading_archive.discard(staged)
+            raise
+        
+        moved += len(rows)
+        touched.update(by_month)
+        archived_readings_counter.inc(len(rows))
+        hot_cache.invalidate(user_id)
+    
+    # Merge the parts of months that are complete or have collected too many
+    for month in touched:
+        if _next_month(month) <= cutoff or len(reading_archive.parts(user_id, month)) > max_parts:
+            reading_archive.compact(user_id, month)
+    return moved
+
+def run_retention(
+    engine: Engine,
+    retention_days: int,
+    chunk_rows: int = 2000,
+    batch_size: int = 1000,
+    max_parts: int = 32
+) -> int:
+    """Archive every reading older than retention_days, returning how many moved"""
+    started = time.perf_counter()
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    with engine.connect() as conn:
+        user_ids = conn.execute(
+            select(HealthData.user_id).where(HealthData.timestamp < cutoff).distinct()
+        ).scalars().all()
+    
+    moved = sum(
+        archive_user_readings(engine, user_id, cutoff, chunk_rows, batch_size, max_parts)
+        for user_id in user_ids
+    )
+    retention_latency_histogram.observe(time.perf_counter() - started)
+    if moved:
+        logger.info(f"Archived {moved} readings older than {cutoff:%Y-%m-%d %H:%M}")
+    return moved
+
+class RetentionJob:
+    """Runs the retention pass and the refresh token purge every interval seconds in a worker thread"""
+    
+    def __init__(
+        self,
+        engine: Engine,
+        retention_days: int,
+        interval: float,
+        chunk_rows: int,
+        batch_size: int,
+        max_parts: int
+    ):
+        self.engine = engine
+        self.retention_days = retention_days
+        self.interval = interval
+        self.chunk_rows = chunk_rows
+        self.batch_size = batch_size
+        self.max_parts = max_parts
+        self._task: Optional[asyncio.Task] = None
+    
+    async def _run(self):
+        while True:
+            if self.retention_days > 0:
+                try:
+                    await asyncio.to_thread(
+                        run_retention, self.engine, self.retention_days,
+                        self.chunk_rows, self.batch_size, self.max_parts
+                    )
+                except Exception as e:
+                    logger.warning(f"Retention pass failed: {e}")
+            try:
+                purged = await asyncio.to_thread(purge_refresh_tokens, self.engine)
+                if purged:
+                    logger.info(f"Purged {purged} dead refresh tokens")
+            except Exception as e:
+                logger.warning(f"Refresh token purge failed: {e}")
+            await asyncio.sleep(self.interval)
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+retention_job = RetentionJob(
+    engine,
+    retention_days=settings.RETENTION_DAYS,
+    interval=settings.RETENTION_INTERVAL_SECONDS,
+    chunk_rows=settings.RETENTION_CHUNK_ROWS,
+    batch_size=settings.RETENTION_BATCH_SIZE,
+    max_parts=settings.ARCHIVE_MAX_PARTS
+)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive readings older than the retention window")
+    parser.add_argument("--days", type=int, default=settings.RETENTION_DAYS, help="retention window in days")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    if args.days <= 0:
+        raise SystemExit("Retention is disabled; pass --days or set RETENTION_DAYS")
+    if args.days < settings.RETENTION_DAYS:
+        # Queries skip the archive for ranges newer than RETENTION_DAYS
+        raise SystemExit(f"--days must be at least RETENTION_DAYS ({settings.RETENTION_DAYS})")
+    moved = run_retention(
+        engine, args.days, settings.RETENTION_CHUNK_ROWS,
+        settings.RETENTION_BATCH_SIZE, settings.ARCHIVE_MAX_PARTS
+    )
+    print(f"Archived {moved} readings")
@@ -1,35 +1,96 @@
 from datetime import datetime, timedelta
 from typing import Optional
+import hashlib
+import secrets
+import time
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from .database import get_db, User
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_async_db, User
+from .auth_cache import RevocationList, TTLCache
 from .config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+# Resolved users keyed by JWT subject; holds column values, never session-bound objects
+user_cache: TTLCache[dict] = TTLCache(
+    "lifecare_user_cache",
+    "authenticated user cache",
+    max_entries=settings.USER_CACHE_MAX_ENTRIES,
+    ttl=settings.USER_CACHE_TTL_SECONDS
+)
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+# Verified claims keyed by the SHA-256 of the raw token, so devices reusing a token skip jwt.decode
+token_cache: TTLCache[dict] = TTLCache(
+    "lifecare_token_cache",
+    "verified token cache",
+    max_entries=settings.TOKEN_CACHE_MAX_ENTRIES,
+    ttl=settings.TOKEN_CACHE_TTL_SECONDS
+)
+
+# jti (or, for older tokens, digest) of each revoked token, kept until the token would have expired anyway.
+# Per process: with several workers a token is only revoked on the one that handled the logout
+revoked_tokens = RevocationList(
+    "lifecare_revoked_tokens",
+    "revoked token list",
+    max_entries=settings.REVOKED_TOKENS_MAX_ENTRIES,
+    ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    now = datetime.utcnow()
     to_encode = data.copy()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+        expire = now + timedelta(minutes=15)
+    # jti makes every token unique, so revoking one session never revokes another
+    to_encode.update({"exp": expire, "iat": now, "jti": secrets.token_urlsafe(16)})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def _token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+def _seconds_until(exp: Optional[float]) -> Optional[float]:
+    return None if exp is None else exp - time.time()
+
+def _revocation_key(digest: bytes, claims: dict):
+    # Tokens issued before jti was added are revoked by digest
+    return claims.get("jti") or digest
+
+def decode_token(token: str) -> dict:
+    """Verified claims of a token, from the token cache when it has been seen before"""
+    digest = _token_digest(token)
+    claims = token_cache.get(digest)
+    if claims is None:
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        token_cache.set(digest, claims, expires_in=_seconds_until(claims.get("exp")))
+    if _revocation_key(digest, claims) in revoked_tokens:
+        raise JWTError("Token has been revoked")
+    return claims
+
+def revoke_token(token: str):
+    """Reject a token from now on, even though its signature and exp are still valid.
+    
+    Only verified tokens are revoked, keyed by their jti. Raises
+    RevocationListFullError rather than dropping a live revocation.
+    """
+    digest = _token_digest(token)
     try:
-        payload = jwt.decode(credentials.credentials, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        claims = decode_token(token)
+    except JWTError:
+        # Forged, expired or already revoked: nothing left to reject
+        return
+    token_cache.pop(digest)
+    revoked_tokens.add(_revocation_key(digest, claims), expires_in=_seconds_until(claims.get("exp")))
+
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    try:
+        payload = decode_token(credentials.credentials)
         username: str = payload.get("sub")
         if username is None:
             raise HTTPException(
@@ -45,11 +106,23 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-def get_current_user(username: str = Depends(verify_token), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
+def invalidate_user(username: str):
+    """Drop a cached user after their profile or active flag changes"""
+    user_cache.pop(username)
+
+async def get_current_user(username: str = Depends(verify_token), db: AsyncSession = Depends(get_async_db)):
+    # Returns a detached User; endpoints that modify it must load their own copy
+    cached = user_cache.get(username)
+    if cached is not None:
+        return User(**cached)
+    
+    result = await db.execute(select(User).where(User.username == username))
+    user = result.scalars().first()
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
+    if user.is_active:
+        user_cache.set(username, {column.name: getattr(user, column.name) for column in User.__table__.columns})
     return user
\ No newline at end of file
@@ -0,0 +1,122 @@
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+import heapq
+import threading
+import time
+from .metrics import Counter, Gauge
+
+V = TypeVar("V")
+
+class TTLCache(Generic[V]):
+    """Thread-safe LRU cache whose entries expire after a TTL or at an explicit deadline.
+    
+    Exports <name>_hits_total, <name>_misses_total and <name>_entries.
+    """
+    
+    def __init__(self, name: str, description: str, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[V, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = Counter(f"{name}_hits_total", f"Lookups answered by the {description}")
+        self.misses = Counter(f"{name}_misses_total", f"Lookups that missed the {description}")
+        self.size = Gauge(f"{name}_entries", f"Entries held by the {description}")
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+    
+    def get(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits.inc()
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+                self.size.set(len(self._entries))
+        self.misses.inc()
+        return None
+    
+    def set(self, key: Hashable, value: V, expires_in: Optional[float] = None):
+        """Store value for ttl seconds, or for expires_in if that is sooner"""
+        if not self.enabled:
+            return
+        lifetime = self.ttl if expires_in is None else min(self.ttl, expires_in)
+        if lifetime <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + lifetime)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.size.set(len(self._entries))
+    
+    def pop(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            self.size.set(len(self._entries))
+        return entry[0] if entry is not None else None
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size.set(0)
+
+class RevocationListFullError(Exception):
+    """Raised when a revocation cannot be recorded without forgetting a live one"""
+
+class RevocationList:
+    """Thread-safe set of revoked keys, each held until its own deadline.
+    
+    Unlike TTLCache it never evicts a live entry: once max_entries keys are
+    unexpired, add raises RevocationListFullError so the caller can fail
+    closed. Entries live in process memory, so a revocation only applies to
+    the worker that recorded it and does not survive a restart.
+    
+    Exports <name>_entries and <name>_rejected_total.
+    """
+    
+    def __init__(self, name: str, description: str, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._deadlines: Dict[Hashable, float] = {}
+        # (deadline, key) min-heap, so expired keys are dropped oldest first
+        self._expiry: List[Tuple[float, Hashable]] = []
+        self._lock = threading.Lock()
+        self.size = Gauge(f"{name}_entries", f"Entries held by the {description}")
+        self.rejected = Counter(f"{name}_rejected_total", f"Additions refused because the {description} was full")
+    
+    def _expire(self, now: float):
+        while self._expiry and self._expiry[0][0] <= now:
+            deadline, key = heapq.heappop(self._expiry)
+            if self._deadlines.get(key) == deadline:
+                del self._deadlines[key]
+    
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            deadline = self._deadlines.get(key)
+            return deadline is not None and deadline > time.monotonic()
+    
+    def add(self, key: Hashable, expires_in: Optional[float] = None):
+        """Hold key for ttl seconds, or for expires_in if that is sooner"""
+        lifetime = self.ttl if expires_in is None else min(self.ttl, expires_in)
+        if lifetime <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if key not in self._deadlines and len(self._deadlines) >= self.max_entries:
+                self.rejected.inc()
+                raise RevocationListFullError(f"{len(self._deadlines)} unexpired revocations held")
+            deadline = max(now + lifetime, self._deadlines.get(key, 0.0))
+            self._deadlines[key] = deadline
+            heapq.heappush(self._expiry, (deadline, key))
+            self.size.set(len(self._deadlines))
+    
+    def clear(self):
+        with self._lock:
+            self._deadlines.clear()
+            self._expiry.clear()
+            self.size.set(0)
@@ -0,0 +1,48 @@
+from sqlalchemy import Table, Column, Integer, String, DateTime, MetaData, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Set, Tuple
+from datetime import datetime
+
+migration_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String),
+    Column("applied_at", DateTime, default=datetime.utcnow)
+)
+
+# Data backfill migrations; until one is applied the table it fills cannot be trusted
+ROLLUP_BACKFILL = 2
+SKETCH_BACKFILL = 4
+BACKFILL_VERSIONS = {ROLLUP_BACKFILL, SKETCH_BACKFILL}
+
+# (database URL, version) pairs seen applied; a backfill is never un-applied
+_applied: Set[Tuple[str, int]] = set()
+
+class BackfillPendingError(Exception):
+    """Raised when a reader needs a backfill that has not been applied yet"""
+
+def _applied_query(version: int):
+    return select(schema_migrations.c.version).where(schema_migrations.c.version == version)
+
+async def backfill_applied(db: AsyncSession, version: int) -> bool:
+    """Whether a backfill migration has run, rechecked until it has (so the CLI needs no restart)"""
+    key = (str(db.bind.url), version)
+    if key in _applied:
+        return True
+    if (await db.execute(_applied_query(version))).first() is None:
+        return False
+    _applied.add(key)
+    return True
+
+def backfill_applied_sync(conn: Connection, version: int) -> bool:
+    key = (str(conn.engine.url), version)
+    if key in _applied:
+        return True
+    if conn.execute(_applied_query(version)).first() is None:
+        return False
+    _applied.add(key)
+    return True
@@ -0,0 +1,176 @@
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+from typing import Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+def average_path_length(n_samples: np.ndarray) -> np.ndarray:
+    """Average path length of an unsuccessful BST search, c(n) in the iForest paper"""
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    result = np.zeros_like(n_samples)
+    
+    mask_2 = n_samples == 2
+    mask_big = n_samples > 2
+    result[mask_2] = 1.0
+    result[mask_big] = (
+        2.0 * (np.log(n_samples[mask_big] - 1.0) + np.euler_gamma)
+        - 2.0 * (n_samples[mask_big] - 1.0) / n_samples[mask_big]
+    )
+    return result
+
+class CompiledIsolationForest:
+    """A fitted IsolationForest flattened into contiguous numpy arrays.
+    
+    All trees share one node table, renumbered so that the right child of
+    every split sits right after its left child. Stepping a sample is then
+    children[node] + (x > threshold). The split feature is encoded in
+    thresholds, which has one row per input feature. A node's threshold is
+    +inf for every feature it does not split on. The StandardScaler is
+    folded into the thresholds, so raw [heart_rate, blood_oxygen] rows are
+    scored directly. Leaves point back at themselves, so every sample can
+    be stepped max_depth times. Each leaf's path_length holds its depth
+    plus the c(n) correction for the samples it held during training.
+    """
+    
+    # Samples scored per vectorized step, keeps the (chunk, n_trees) node
+    # matrix small enough to stay in cache
+    chunk_size = 256
+    
+    def __init__(
+        self,
+        thresholds: np.ndarray,
+        children: np.ndarray,
+        path_length: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+        denominator: float,
+        offset: float
+    ):
+        self.thresholds = thresholds
+        self.children = children
+        self.path_length = path_length
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.denominator = float(denominator)
+        self.offset = float(offset)
+    
+    @classmethod
+    def from_sklearn(cls, model: IsolationForest, scaler: StandardScaler) -> "CompiledIsolationForest":
+        """Flatten a fitted forest and fold the scaler into its thresholds"""
+        mean = scaler.mean_
+        scale = scaler.scale_
+        n_features = model.n_features_in_
+        subsample_features = getattr(model, "_max_features", n_features) != n_features
+        
+        thresholds, children, path_lengths, roots = [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator, estimator_features in zip(model.estimators_, model.estimators_features_):
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            
+            # Breadth-first renumbering that keeps sibling pairs adjacent
+            order = [0]
+            depth = np.zeros(n_nodes, dtype=np.int64)
+            new_left = np.zeros(n_nodes, dtype=np.int64)
+            for position in range(n_nodes):
+                node = order[position]
+                left, right = tree.children_left[node], tree.children_right[node]
+                if left == -1:
+                    new_left[position] = position
+                else:
+                    new_left[position] = len(order)
+                    depth[left] = depth[right] = depth[node] + 1
+                    order.extend([left, right])
+            order = np.asarray(order)
+            
+            is_leaf = tree.children_left[order] == -1
+            feature = tree.feature[order]
+            if subsample_features:
+                feature = np.where(is_leaf, -1, np.asarray(estimator_features)[np.where(is_leaf, 0, feature)])
+            
+            # x_scaled <= t  <=>  x <= t * scale + mean (scale is positive)
+            threshold = np.full((n_features, n_nodes), np.inf)
+            split_nodes = np.flatnonzero(~is_leaf)
+            split_features = feature[split_nodes]
+            threshold[split_features, split_nodes] = (
+                tree.threshold[order][split_nodes] * scale[split_features] + mean[split_features]
+            )
+            
+            thresholds.append(threshold)
+            children.append(new_left + offset)
+            path_lengths.append(np.where(
+                is_leaf, depth[order] + average_path_length(tree.n_node_samples[order]), 0.0
+            ))
+            roots.append(offset)
+            max_depth = max(max_depth, int(depth.max()))
+            offset += n_nodes
+        
+        denominator = len(model.estimators_) * average_path_length([model.max_samples_])[0]
+        
+        return cls(
+            thresholds=np.ascontiguousarray(np.concatenate(thresholds, axis=1)),
+            children=np.concatenate(children).astype(np.intp),
+            path_length=np.concatenate(path_lengths).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            denominator=denominator,
+            offset=model.offset_
+        )
+    
+    def path_lengths(self, X: np.ndarray) -> np.ndarray:
+        """Summed path length of every row across all trees"""
+        X = np.asarray(X, dtype=np.float64)
+        depths = np.empty(X.shape[0])
+        n_trees = self.roots.shape[0]
+        
+        for start in range(0, X.shape[0], self.chunk_size):
+            X_chunk = X[start:start + self.chunk_size]
+            columns = [X_chunk[:, i:i + 1] for i in range(X_chunk.shape[1])]
+            nodes = np.broadcast_to(self.roots, (X_chunk.shape[0], n_trees))
+            
+            for _ in range(self.max_depth):
+                go_right = columns[0] > self.thresholds[0].take(nodes)
+                for i in range(1, len(columns)):
+                    go_right |= columns[i] > self.thresholds[i].take(nodes)
+                nodes = self.children.take(nodes) + go_right
+            
+            depths[start:start + self.chunk_size] = self.path_length.take(nodes).sum(axis=1)
+        
+        return depths
+    
+    def score(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (decision_function, is_anomaly) for raw feature rows in one pass"""
+        depths = self.path_lengths(X)
+        if self.denominator > 0:
+            score_samples = -(2.0 ** (-depths / self.denominator))
+        else:
+            score_samples = np.full(depths.shape[0], -0.5)
+        
+        anomaly_scores = score_samples - self.offset
+        return anomaly_scores, anomaly_scores < 0
+    
+    def max_abs_error(self, model: IsolationForest, scaler: StandardScaler, X: np.ndarray) -> Tuple[float, int]:
+        """Compare against sklearn, returning the max score error and label mismatches"""
+        expected = model.decision_function(scaler.transform(X))
+        actual, is_anomaly = self.score(X)
+        return float(np.max(np.abs(actual - expected))), int(np.sum(is_anomaly != (expected < 0)))
+    
+    def save(self, path: str):
+        np.savez(
+            path,
+            thresholds=self.thresholds,
+            children=self.children,
+            path_length=self.path_length,
+            roots=self.roots,
+            max_depth=self.max_depth,
+            denominator=self.denominator,
+            offset=self.offset
+        )
+    
+    @classmethod
+    def load(cls, path: str) -> "CompiledIsolationForest":
+        with np.load(path) as data:
+            return cls(**{key: data[key] for key in data.files})
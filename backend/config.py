@@ -5,6 +5,10 @@ import os
 class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "sqlite:///./lifecare.db"
+    ASYNC_DATABASE_URL: Optional[str] = None  # derived from DATABASE_URL when unset
+    SQLITE_PROFILE: str = "durable"  # 'default', 'durable' or 'throughput' (may lose the last commits on power loss)
+    SQLITE_CHECKPOINT_INTERVAL_SECONDS: float = 30.0
+    SQLITE_OPTIMIZE_INTERVAL_SECONDS: float = 3600.0
     
     # Redis
     REDIS_URL: str = "redis://localhost:6379"
@@ -13,9 +17,56 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "your-secret-key-change-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    USER_CACHE_TTL_SECONDS: float = 60.0  # 0 disables
+    USER_CACHE_MAX_ENTRIES: int = 10000
+    TOKEN_CACHE_TTL_SECONDS: float = 300.0  # verified claims are also dropped at the token's exp; 0 disables
+    TOKEN_CACHE_MAX_ENTRIES: int = 100000
+    REVOKED_TOKENS_MAX_ENTRIES: int = 100000
+    BCRYPT_ROUNDS: int = 12  # existing hashes are upgraded at their next login
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 32  # beyond this, register/login answer 503
     
     # ML Model
     MODEL_PATH: str = "models/anomaly_model.pkl"
+    ML_SCORING_MODE: str = "compiled"  # 'sklearn', 'compiled' or 'grid'
+    ML_GRID_RESOLUTION: int = 256
+    ML_BATCH_WINDOW_MS: float = 2.0
+    ML_BATCH_MAX_SIZE: int = 256
+    ML_EXECUTOR: str = "thread"  # 'thread' or 'process'
+    ML_EXECUTOR_WORKERS: int = 2
+    ML_MAX_CONCURRENCY: int = 4
+    ML_QUEUE_TIMEOUT_SECONDS: float = 1.0
+    
+    # Ingest
+    INGEST_GROUP_COMMIT_MS: float = 5.0
+    INGEST_GROUP_COMMIT_MAX_ROWS: int = 500
+    INGEST_STREAM_CHUNK_SIZE: int = 1000
+    INGEST_STREAM_MAX_LINE_BYTES: int = 65536
+    
+    # WebSocket
+    WS_SEND_TIMEOUT_SECONDS: float = 1.0  # a socket slower than this is dropped
+    WS_AUTH_TIMEOUT_SECONDS: float = 10.0  # time allowed for the first auth frame
+    
+    # Hot window cache
+    HOT_CACHE_CAPACITY: int = 256  # newest readings kept per user
+    HOT_CACHE_MAX_BYTES: int = 67108864  # 64 MiB across all users; 0 disables
+    
+    # Dashboard response cache
+    DASHBOARD_CACHE_TTL_SECONDS: float = 60.0  # 0 disables
+    DASHBOARD_CACHE_MAX_ENTRIES: int = 10000
+    
+    # Population quantile sketches
+    SKETCH_K: int = 200
+    SKETCH_FLUSH_INTERVAL_SECONDS: float = 10.0
+    
+    # Retention
+    RETENTION_DAYS: int = 0  # opt in (e.g. 90) to move older readings to the archive
+    RETENTION_INTERVAL_SECONDS: float = 3600.0
+    RETENTION_CHUNK_ROWS: int = 2000  # readings moved (and deleted in one transaction) at a time
+    RETENTION_BATCH_SIZE: int = 1000
+    ARCHIVE_DIR: str = "archive"
+    ARCHIVE_MAX_PARTS: int = 32  # part files a month may collect before it is compacted
     
     # API
     API_V1_STR: str = "/api/v1"
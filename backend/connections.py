@@ -0,0 +1,81 @@
+from fastapi import WebSocket
+from typing import Dict, Iterable, Set, Tuple
+import asyncio
+import json
+import logging
+from .metrics import Counter, Gauge
+from .tasks import TaskSet
+
+logger = logging.getLogger(__name__)
+
+ws_connections = Gauge("lifecare_ws_connections", "Open WebSocket connections")
+ws_send_failures = Counter("lifecare_ws_send_failures_total", "WebSocket sends that failed or timed out")
+
+class ConnectionManager:
+    """Open sockets per user, with fan-out that encodes each message once.
+    
+    Sends to every target socket run concurrently, each bounded by
+    send_timeout, so one slow client cannot hold up the rest. A socket whose
+    send fails or times out is dropped and closed.
+    """
+    
+    def __init__(self, send_timeout: float = 1.0):
+        self.send_timeout = send_timeout
+        self.active_connections: Dict[str, Set[WebSocket]] = {}
+        self._count = 0
+        self._closes = TaskSet("socket close")
+    
+    async def connect(self, websocket: WebSocket, user_id: str):
+        """Register an accepted, authenticated socket"""
+        self.active_connections.setdefault(user_id, set()).add(websocket)
+        self._count += 1
+        ws_connections.set(self._count)
+        logger.info(f"WebSocket connected for user: {user_id}")
+    
+    def _discard(self, websocket: WebSocket, user_id: str):
+        connections = self.active_connections.get(user_id)
+        if connections is None or websocket not in connections:
+            return
+        connections.discard(websocket)
+        if not connections:
+            del self.active_connections[user_id]
+        self._count -= 1
+        ws_connections.set(self._count)
+    
+    def disconnect(self, websocket: WebSocket, user_id: str):
+        self._discard(websocket, user_id)
+        logger.info(f"WebSocket disconnected for user: {user_id}")
+    
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=1013), timeout=self.send_timeout)
+        except Exception:
+            pass
+    
+    async def _fan_out(self, targets: Iterable[Tuple[str, WebSocket]], text: str):
+        # Snapshot the targets; connect/disconnect may run while sends are awaited
+        targets = list(targets)
+        if not targets:
+            return
+        # All sends start together, so one shared deadline is each send's timeout
+        sends = [asyncio.ensure_future(websocket.send_text(text)) for _, websocket in targets]
+        _, pending = await asyncio.wait(sends, timeout=self.send_timeout)
+        for send in pending:
+            send.cancel()
+        
+        for (user_id, websocket), send in zip(targets, sends):
+            if send in pending or send.cancelled() or send.exception() is not None:
+                ws_send_failures.inc()
+                self._discard(websocket, user_id)
+                self._closes.spawn(self._close(websocket))
+    
+    async def send_personal_message(self, message: dict, user_id: str):
+        connections = self.active_connections.get(user_id)
+        if connections:
+            await self._fan_out(((user_id, connection) for connection in connections), json.dumps(message))
+    
+    async def broadcast_to_all(self, message: dict):
+        await self._fan_out(
+            ((user_id, connection) for user_id, connections in self.active_connections.items() for connection in connections),
+            json.dumps(message)
+        )
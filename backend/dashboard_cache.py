@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Set, Tuple
+from datetime import datetime
+import hashlib
+import threading
+import time
+from .config import settings
+from .metrics import Counter
+
+dashboard_cache_hits = Counter("lifecare_dashboard_cache_hits_total", "Dashboards served from the response cache")
+dashboard_cache_not_modified = Counter("lifecare_dashboard_not_modified_total", "Dashboard polls answered with 304 Not Modified")
+dashboard_cache_misses = Counter("lifecare_dashboard_cache_misses_total", "Dashboards rebuilt from the database")
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    expires_at: float
+
+def make_etag(body: bytes) -> str:
+    """Strong validator derived from the exact response bytes"""
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match comparison (weak, as RFC 9110 requires for this header)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates)
+
+class DashboardCache:
+    """Assembled dashboard payloads per (user, view), dropped when the user's data changes.
+    
+    Writers call invalidate() after committing, which drops all of the
+    user's entries at once. Dashboards are built inside building(), and
+    put() refuses a payload when the user was invalidated after its build
+    began, so one built while a write was in flight is never served. Entries
+    also expire after ttl seconds and at the end of the current trend
+    bucket, since the 24h window and trend labels move with time.
+    
+    The cache and its invalidations are per process; the Dockerfile runs a
+    single worker, and with more a write only clears the worker that took it.
+    """
+    
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, CachedResponse]" = OrderedDict()
+        self._keys: Dict[str, Set[Tuple]] = {}
+        # Every invalidation ticks the clock; while a user has builds in flight
+        # their last invalidation time is kept, so put() can spot a stale build
+        self._clock = 0
+        self._builds: Dict[str, int] = {}
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+    
+    @contextmanager
+    def building(self, user_id: str) -> Iterator[int]:
+        """Version to pass to put() for a dashboard built inside the block"""
+        with self._lock:
+            self._builds[user_id] = self._builds.get(user_id, 0) + 1
+            version = self._clock
+        try:
+            yield version
+        finally:
+            with self._lock:
+                self._builds[user_id] -= 1
+                if not self._builds[user_id]:
+                    del self._builds[user_id]
+                    self._versions.pop(user_id, None)
+    
+    def _remove(self, key: Tuple):
+        del self._entries[key]
+        keys = self._keys[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._keys[key[0]]
+    
+    def get(self, key: Tuple) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+    
+    def put(self, key: Tuple, version: int, body: bytes, valid_until: Optional[datetime] = None) -> CachedResponse:
+        ttl = self.ttl
+        if valid_until is not None:
+            ttl = min(ttl, (valid_until - datetime.utcnow()).total_seconds())
+        entry = CachedResponse(body, make_etag(body), time.monotonic() + ttl)
+        
+        with self._lock:
+            if self.enabled and ttl > 0 and self._versions.get(key[0], 0) <= version:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                self._keys.setdefault(key[0], set()).add(key)
+                while len(self._entries) > self.max_entries:
+                    self._remove(next(iter(self._entries)))
+        return entry
+    
+    def invalidate(self, user_ids: Iterable[str]):
+        """Drop every cached dashboard of these users"""
+        with self._lock:
+            self._clock += 1
+            for user_id in set(user_ids):
+                if user_id in self._builds:
+                    self._versions[user_id] = self._clock
+                for key in self._keys.pop(user_id, ()):
+                    del self._entries[key]
+
+dashboard_cache = DashboardCache(
+    ttl=settings.DASHBOARD_CACHE_TTL_SECONDS,
+    max_entries=settings.DASHBOARD_CACHE_MAX_ENTRIES
+)
@@ -1,10 +1,40 @@
-from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime, Boolean
+from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime, Boolean, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from datetime import datetime
 from .config import settings
+from .storage import is_sqlite, apply_sqlite_profile, SQLiteMaintenance
 
 engine = create_engine(settings.DATABASE_URL)
+# Dedicated connection for the ingest writer so group commits never queue
+# behind request sessions waiting for a pooled connection
+writer_engine = create_engine(settings.DATABASE_URL, pool_size=1, max_overflow=0)
+
+def async_database_url(url: str) -> str:
+    """Map a sync database URL onto its asyncio driver"""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:") or url.startswith("postgres:"):
+        return "postgresql+asyncpg:" + url.split(":", 1)[1]
+    return url
+
+# Non-blocking engine for the request handlers; the sync engines above stay
+# in use for work that already runs on worker threads
+async_engine = create_async_engine(settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+storage_maintenance = None
+if is_sqlite(settings.DATABASE_URL):
+    apply_sqlite_profile(engine, settings.SQLITE_PROFILE)
+    apply_sqlite_profile(writer_engine, settings.SQLITE_PROFILE)
+    apply_sqlite_profile(async_engine.sync_engine, settings.SQLITE_PROFILE)
+    if settings.SQLITE_PROFILE != "default":
+        storage_maintenance = SQLiteMaintenance(
+            engine,
+            checkpoint_interval=settings.SQLITE_CHECKPOINT_INTERVAL_SECONDS,
+            optimize_interval=settings.SQLITE_OPTIMIZE_INTERVAL_SECONDS
+        )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -23,6 +53,42 @@ class HealthData(Base):
     anomaly_score = Column(Float, nullable=True)
     is_anomaly = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_health_data_user_id_timestamp', 'user_id', 'timestamp'),
+        Index('ix_health_data_user_id_is_anomaly_timestamp', 'user_id', 'is_anomaly', 'timestamp'),
+    )
+
+class _RollupColumns:
+    """Per-user aggregates of the readings whose timestamp falls in one bucket"""
+    user_id = Column(String, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    reading_count = Column(Integer, default=0)
+    anomaly_count = Column(Integer, default=0)
+    heart_rate_sum = Column(Float, default=0.0)
+    heart_rate_sq_sum = Column(Float, default=0.0)
+    heart_rate_min = Column(Float)
+    heart_rate_max = Column(Float)
+    blood_oxygen_sum = Column(Float, default=0.0)
+    blood_oxygen_sq_sum = Column(Float, default=0.0)
+    blood_oxygen_min = Column(Float)
+    blood_oxygen_max = Column(Float)
+    last_timestamp = Column(DateTime)
+
+class HealthRollupHourly(_RollupColumns, Base):
+    __tablename__ = "health_rollups_hourly"
+
+class HealthRollupDaily(_RollupColumns, Base):
+    __tablename__ = "health_rollups_daily"
+
+class VitalsSketch(Base):
+    """Serialized KLL quantile sketch of one vital across all users for one hour"""
+    __tablename__ = "vitals_sketches"
+    
+    bucket_start = Column(DateTime, primary_key=True)
+    metric = Column(String, primary_key=True)
+    count = Column(Integer, default=0)
+    sketch = Column(LargeBinary)
 
 class User(Base):
     __tablename__ = "users"
@@ -38,6 +104,18 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class RefreshToken(Base):
+    """Issued refresh token; only its HMAC digest is stored"""
+    __tablename__ = "refresh_tokens"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    token_digest = Column(String, unique=True, index=True)
+    user_id = Column(String, index=True)
+    family_id = Column(String, index=True)  # shared by a token and every rotation of it
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime)
+    revoked_at = Column(DateTime, nullable=True)
+
 class Alert(Base):
     __tablename__ = "alerts"
     
@@ -48,6 +126,11 @@ class Alert(Base):
     severity = Column(String)  # 'low', 'medium', 'high', 'critical'
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_alerts_user_id_is_read_created_at', 'user_id', 'is_read', 'created_at'),
+        Index('ix_alerts_user_id_created_at', 'user_id', 'created_at'),
+    )
 
 def get_db():
     db = SessionLocal()
@@ -56,5 +139,6 @@ def get_db():
     finally:
         db.close()
 
-# Create tables
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
\ No newline at end of file
@@ -0,0 +1,235 @@
+from sqlalchemy import select, func, cast, Integer, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, NamedTuple, Optional, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import numpy as np
+from .archive import reading_archive
+from .backfills import ROLLUP_BACKFILL, backfill_applied
+from .database import HealthData
+from .models import DownsampledSeries
+from .rollups import BUCKET_SIZES, ROLLUP_TABLES, bucket_ceil, bucket_start, plan_range
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of at most threshold points preserving the visual shape"""
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold <= 2:
+        return np.array([0, n - 1][:threshold], dtype=np.int64)
+    
+    # Interior points are split into threshold - 2 buckets; first and last are always kept
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third triangle vertex
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        areas = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(areas.argmax())
+        selected[i + 1] = a
+    return selected
+
+def _seconds(timestamps: np.ndarray, origin: datetime) -> np.ndarray:
+    return (timestamps - np.datetime64(origin, 'us')) / np.timedelta64(1, 's')
+
+def _bucket_index(dialect: str, column, start: datetime, width: float):
+    """SQL expression numbering width-second buckets from start"""
+    if dialect == "postgresql":
+        return func.floor(func.extract('epoch', column - literal(start)) / width)
+    return cast((func.julianday(column) - func.julianday(literal(start))) * 86400.0 / width, Integer)
+
+# LTTB runs on the raw readings only while a range holds at most this many
+# per output point; beyond that it runs on SQL-reduced bucket means
+LTTB_OVERSAMPLE = 4
+
+async def _raw_series(db: AsyncSession, user_id: str, metric: str, start: datetime, end: datetime) -> Tuple[np.ndarray, np.ndarray]:
+    """Timestamps (seconds from start) and values of a metric, hot and archived, in time order"""
+    column = getattr(HealthData, metric)
+    result = await db.execute(select(HealthData.timestamp, column).where(
+        HealthData.user_id == user_id,
+        HealthData.timestamp >= start,
+        HealthData.timestamp < end
+    ).order_by(HealthData.timestamp))
+    rows = result.all()
+    timestamps = np.array([row[0] for row in rows], dtype='datetime64[us]')
+    values = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    
+    if reading_archive.may_contain(start):
+        archived_timestamps, archived_values = await asyncio.to_thread(reading_archive.series, user_id, metric, start, end)
+        if len(archived_timestamps):
+            timestamps = np.concatenate([archived_timestamps, timestamps])
+            values = np.concatenate([archived_values, values])
+            order = np.argsort(timestamps, kind='stable')
+            timestamps, values = timestamps[order], values[order]
+    return _seconds(timestamps, start), values
+
+class BucketGrid(NamedTuple):
+    """Output buckets of width seconds from origin, clipped to [start, end)"""
+    origin: datetime
+    width: float
+    count: int
+    # (rollup bucket or None for raw readings, lo, hi) covering [start, end)
+    segments: List[Tuple[Optional[str], datetime, datetime]]
+
+def plan_grid(start: datetime, end: datetime, points: int, rollups: bool = True) -> BucketGrid:
+    """Lay out at most points buckets over [start, end), aligned to the rollups where they are wide enough.
+    
+    Buckets of an hour or more are whole multiples of an hour (or a day) and
+    start on an hour (day) boundary, so every rollup row falls inside exactly
+    one bucket; only the partial first and last rollup periods come from raw
+    readings, as in rollups.range_aggregate. With rollups=False (their
+    backfill is pending) every bucket comes from raw readings.
+    """
+    span = (end - start).total_seconds()
+    width = max(span / points, 1.0)
+    if width < 3600:
+        return BucketGrid(start, width, min(points, int(np.ceil(span / width))), [(None, start, end)])
+    
+    bucket = 'day' if width >= 86400 else 'hour'
+    step = BUCKET_SIZES[bucket].total_seconds()
+    origin = bucket_start(start, bucket)
+    width = np.ceil(width / step) * step
+    while np.ceil((end - origin).total_seconds() / width) > points:
+        width += step
+    count = int(np.ceil((end - origin).total_seconds() / width))
+    
+    if not rollups:
+        segments = [(None, start, end)]
+    elif bucket == 'day':
+        segments = plan_range(start, end)
+    else:
+        first_hour, last_hour = bucket_ceil(start, 'hour'), bucket_start(end, 'hour')
+        if first_hour >= last_hour:
+            segments = [(None, start, end)]
+        else:
+            segments = [(None, start, first_hour), ('hour', first_hour, last_hour), (None, last_hour, end)]
+    return BucketGrid(origin, float(width), count, [(b, lo, hi) for b, lo, hi in segments if lo < hi])
+
+async def _minmax_buckets(
+    db: AsyncSession,
+    user_id: str,
+    metric: str,
+    grid: BucketGrid
+) -> Tuple[np.ndarray, ...]:
+    """Per-bucket count, sum, min and max of a metric.
+    
+    Rollup segments read one row per rollup period; raw segments are grouped
+    by bucket in SQL and fold in archived readings.
+    """
+    counts = np.zeros(grid.count, dtype=np.int64)
+    sums = np.zeros(grid.count)
+    mins = np.full(grid.count, np.inf)
+    maxs = np.full(grid.count, -np.inf)
+    
+    def fold(buckets, count, total, low, high):
+        buckets = np.minimum(buckets, grid.count - 1)
+        np.add.at(counts, buckets, count)
+        np.add.at(sums, buckets, total)
+        np.minimum.at(mins, buckets, low)
+        np.maximum.at(maxs, buckets, high)
+    
+    for bucket, lo, hi in grid.segments:
+        if bucket is not None:
+            # Rollup periods never straddle a bucket, so index them exactly in numpy
+            table = ROLLUP_TABLES[bucket]
+            result = await db.execute(select(
+                table.bucket_start,
+                table.reading_count,
+                getattr(table, f"{metric}_sum"),
+                getattr(table, f"{metric}_min"),
+                getattr(table, f"{metric}_max")
+            ).where(table.user_id == user_id, table.bucket_start >= lo, table.bucket_start < hi))
+            rows = result.all()
+            if rows:
+                starts, count, total, low, high = (np.array(column) for column in zip(*rows))
+                buckets = (_seconds(starts.astype('datetime64[us]'), grid.origin) // grid.width).astype(np.int64)
+                fold(buckets, count, total.astype(float), low.astype(float), high.astype(float))
+            continue
+        
+        value = getattr(HealthData, metric)
+        index = _bucket_index(db.bind.dialect.name, HealthData.timestamp, grid.origin, grid.width).label('bucket')
+        result = await db.execute(select(
+            index, func.count(value), func.sum(value), func.min(value), func.max(value)
+        ).where(
+            HealthData.user_id == user_id,
+            HealthData.timestamp >= lo,
+            HealthData.timestamp < hi
+        ).group_by(index))
+        rows = result.all()
+        if rows:
+            buckets, count, total, low, high = (np.array(column) for column in zip(*rows))
+            fold(buckets.astype(np.int64), count, total.astype(float), low.astype(float), high.astype(float))
+        
+        if reading_archive.may_contain(lo):
+            archived_timestamps, archived_values = await asyncio.to_thread(reading_archive.series, user_id, metric, lo, hi)
+            if len(archived_values):
+                buckets = (_seconds(archived_timestamps, grid.origin) // grid.width).astype(np.int64)
+                fold(buckets, 1, archived_values, archived_values, archived_values)
+    
+    return counts, sums, mins, maxs
+
+def _bucket_times(grid: BucketGrid, start: datetime, buckets: np.ndarray) -> List[datetime]:
+    return [max(grid.origin + timedelta(seconds=float(i * grid.width)), start) for i in buckets]
+
+async def downsample_series(
+    db: AsyncSession,
+    user_id: str,
+    metric: str,
+    start: datetime,
+    end: datetime,
+    points: int,
+    method: str = "minmax"
+) -> DownsampledSeries:
+    """A chart-ready series of at most points entries for [start, end)"""
+    rollups = await backfill_applied(db, ROLLUP_BACKFILL)
+    if method == "lttb":
+        # Reduce in SQL first, so the cost follows the point count rather than the readings
+        grid = plan_grid(start, end, points * LTTB_OVERSAMPLE, rollups)
+        counts, sums, _, _ = await _minmax_buckets(db, user_id, metric, grid)
+        total = int(counts.sum())
+        if total <= points * LTTB_OVERSAMPLE:
+            x, y = await _raw_series(db, user_id, metric, start, end)
+            bucket_seconds = None
+        else:
+            filled = np.flatnonzero(counts)
+            # Each bucket becomes one point at its middle, clipped to the range
+            lo = np.maximum(filled * grid.width, _seconds(np.datetime64(start, 'us'), grid.origin))
+            hi = np.minimum((filled + 1) * grid.width, _seconds(np.datetime64(end, 'us'), grid.origin))
+            x = (lo + hi) / 2 - _seconds(np.datetime64(start, 'us'), grid.origin)
+            y = sums[filled] / counts[filled]
+            bucket_seconds = grid.width
+        selected = await asyncio.to_thread(lttb, x, y, points)
+        return DownsampledSeries(
+            user_id=user_id,
+            metric=metric,
+            method=method,
+            start=start,
+            end=end,
+            total_readings=total,
+            bucket_seconds=bucket_seconds,
+            timestamps=[start + timedelta(seconds=float(s)) for s in x[selected]],
+            values=y[selected].tolist()
+        )
+    
+    grid = plan_grid(start, end, points, rollups)
+    counts, sums, mins, maxs = await _minmax_buckets(db, user_id, metric, grid)
+    
+    filled = np.flatnonzero(counts)
+    return DownsampledSeries(
+        user_id=user_id,
+        metric=metric,
+        method=method,
+        start=start,
+        end=end,
+        total_readings=int(counts.sum()),
+        bucket_seconds=grid.width,
+        timestamps=_bucket_times(grid, start, filled),
+        values=(sums[filled] / counts[filled]).tolist(),
+        min_values=mins[filled].tolist(),
+        max_values=maxs[filled].tolist()
+    )
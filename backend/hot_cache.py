@@ -0,0 +1,255 @@
+from sqlalchemy import select
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+from datetime import datetime
+import threading
+import numpy as np
+from .config import settings
+from .database import AsyncSessionLocal, HealthData
+from .metrics import Counter, Gauge
+
+FLOAT_COLUMNS = (
+    'heart_rate', 'blood_oxygen', 'temperature',
+    'blood_pressure_systolic', 'blood_pressure_diastolic', 'anomaly_score'
+)
+
+hot_cache_hits = Counter("lifecare_hot_cache_hits_total", "Recent-reading reads served from memory")
+hot_cache_misses = Counter("lifecare_hot_cache_misses_total", "Recent-reading reads that fell back to the database")
+hot_cache_bytes = Gauge("lifecare_hot_cache_bytes", "Memory held by cached reading windows")
+hot_cache_users = Gauge("lifecare_hot_cache_users", "Users with a cached reading window")
+
+class ReadingRing:
+    """Fixed-capacity ring buffer of one user's newest readings, ordered by (timestamp, id).
+    
+    complete is True while the ring holds every reading the user has, i.e.
+    until it first drops one to make room.
+    """
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.id = np.zeros(capacity, dtype=np.int64)
+        self.timestamp = np.zeros(capacity, dtype='datetime64[us]')
+        self.created_at = np.zeros(capacity, dtype='datetime64[us]')
+        self.is_anomaly = np.zeros(capacity, dtype=bool)
+        self.floats = {name: np.full(capacity, np.nan) for name in FLOAT_COLUMNS}
+        self.activity_level = np.empty(capacity, dtype=object)
+        self.head = 0
+        self.size = 0
+        self.complete = True
+    
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.id, self.timestamp, self.created_at, self.is_anomaly, self.activity_level, *self.floats.values()]
+        return sum(array.nbytes for array in arrays)
+    
+    def _order(self) -> np.ndarray:
+        return (self.head + np.arange(self.size)) % self.capacity
+    
+    def _write(self, slot: int, row: Dict[str, Any]):
+        self.id[slot] = row['id']
+        self.timestamp[slot] = row['timestamp']
+        self.created_at[slot] = row['created_at']
+        self.is_anomaly[slot] = bool(row['is_anomaly'])
+        for name, array in self.floats.items():
+            array[slot] = np.nan if row[name] is None else row[name]
+        self.activity_level[slot] = row['activity_level']
+    
+    def _key(self, slot: int):
+        return (self.timestamp[slot], self.id[slot])
+    
+    def add(self, row: Dict[str, Any]):
+        key = (np.datetime64(row['timestamp'], 'us'), row['id'])
+        if self.size:
+            newest = (self.head + self.size - 1) % self.capacity
+            if key <= self._key(newest):
+                self._insert_ordered(row, key)
+                return
+        
+        slot = (self.head + self.size) % self.capacity
+        self._write(slot, row)
+        if self.size == self.capacity:
+            self.head = (self.head + 1) % self.capacity
+            self.complete = False
+        else:
+            self.size += 1
+    
+    def _insert_ordered(self, row: Dict[str, Any], key):
+        # Late (backfilled) readings are rare; re-lay the ring in order around them
+        order = self._order()
+        if np.any(self.id[order] == row['id']):
+            return
+        if self.size == self.capacity and key < self._key(order[0]):
+            return
+        
+        rows = self.rows(order)
+        position = sum(1 for r in rows if (np.datetime64(r['timestamp'], 'us'), r['id']) < key)
+        rows.insert(position, row)
+        if len(rows) > self.capacity:
+            rows = rows[1:]
+            self.complete = False
+        self.head = 0
+        self.size = len(rows)
+        for slot, r in enumerate(rows):
+            self._write(slot, r)
+    
+    def rows(self, slots: np.ndarray) -> List[Dict[str, Any]]:
+        ids = self.id[slots].tolist()
+        timestamps = self.timestamp[slots].tolist()
+        created = self.created_at[slots].tolist()
+        anomalies = self.is_anomaly[slots].tolist()
+        floats = {name: array[slots].tolist() for name, array in self.floats.items()}
+        levels = self.activity_level[slots].tolist()
+        rows = []
+        for i in range(len(ids)):
+            row = {
+                'id': ids[i],
+                'timestamp': timestamps[i],
+                'created_at': created[i],
+                'is_anomaly': anomalies[i],
+                'activity_level': levels[i]
+            }
+            for name, values in floats.items():
+                row[name] = None if values[i] != values[i] else values[i]
+            rows.append(row)
+        return rows
+    
+    def contains(self, row_id: int) -> bool:
+        return bool(np.any(self.id[self._order()] == row_id))
+    
+    def newest(self, limit: int, since: Optional[datetime] = None) -> Optional[List[Dict[str, Any]]]:
+        """Newest readings (at or after since) or None when the ring cannot answer exactly"""
+        newest_first = self._order()[::-1]
+        if since is not None:
+            newest_first = newest_first[self.timestamp[newest_first] >= np.datetime64(since, 'us')]
+            # Readings older than the ring's oldest one may still be newer than since
+            covers_since = self.size and self.timestamp[self._order()[0]] < np.datetime64(since, 'us')
+        else:
+            covers_since = False
+        
+        if len(newest_first) < limit and not (self.complete or covers_since):
+            return None
+        return self.rows(newest_first[:limit])
+
+class HotWindowCache:
+    """Process-local LRU cache of each active user's newest readings.
+    
+    A window is loaded from the database on a user's first read and kept
+    current by the ingest path afterwards; ingest never creates windows, so a
+    cached window always matches the table. Least recently used windows are
+    dropped once the cache holds more than max_bytes.
+    """
+    
+    def __init__(self, capacity: int, max_bytes: int):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self._windows: "OrderedDict[str, ReadingRing]" = OrderedDict()
+        self._bytes = 0
+        # Every write ticks the clock; while a user has loads in flight their
+        # last write time is kept, so a load that raced a write is discarded
+        self._clock = 0
+        self._loads: Dict[str, int] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.capacity > 0
+    
+    def push(self, rows: Iterable[Dict[str, Any]]):
+        """Fold committed readings (with their ids) into the cached windows"""
+        if not self.enabled:
+            return
+        with self._lock:
+            for row in rows:
+                user_id = row['user_id']
+                self._touch(user_id)
+                ring = self._windows.get(user_id)
+                if ring is not None and not ring.contains(row['id']):
+                    ring.add(row)
+    
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._touch(user_id)
+            ring = self._windows.pop(user_id, None)
+            if ring is not None:
+                self._bytes -= ring.nbytes
+                self._update_gauges()
+    
+    def _touch(self, user_id: str):
+        self._clock += 1
+        if user_id in self._loads:
+            self._generations[user_id] = self._clock
+    
+    def _begin_load(self, user_id: str) -> int:
+        with self._lock:
+            self._loads[user_id] = self._loads.get(user_id, 0) + 1
+            return self._clock
+    
+    def _end_load(self, user_id: str):
+        # Called under the lock; the last load out forgets the user's write time
+        self._loads[user_id] -= 1
+        if not self._loads[user_id]:
+            del self._loads[user_id]
+            self._generations.pop(user_id, None)
+    
+    def _update_gauges(self):
+        hot_cache_bytes.set(self._bytes)
+        hot_cache_users.set(len(self._windows))
+    
+    def _install(self, user_id: str, ring: Optional[ReadingRing], generation: int):
+        with self._lock:
+            stale = self._generations.get(user_id, 0) > generation
+            self._end_load(user_id)
+            if ring is None or stale or user_id in self._windows:
+                return
+            self._windows[user_id] = ring
+            self._bytes += ring.nbytes
+            while self._bytes > self.max_bytes and self._windows:
+                _, evicted = self._windows.popitem(last=False)
+                self._bytes -= evicted.nbytes
+            self._update_gauges()
+    
+    async def _load(self, user_id: str) -> ReadingRing:
+        generation = self._begin_load(user_id)
+        ring = None
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(select(HealthData).where(
+                    HealthData.user_id == user_id
+                ).order_by(HealthData.timestamp.desc(), HealthData.id.desc()).limit(self.capacity))
+                readings = result.scalars().all()
+            
+            ring = ReadingRing(self.capacity)
+            for reading in reversed(readings):
+                ring.add({column.name: getattr(reading, column.name) for column in HealthData.__table__.columns})
+            ring.complete = len(readings) < self.capacity
+        finally:
+            # Also ends a failed load, so its user's write time is not kept forever
+            self._install(user_id, ring, generation)
+        return ring
+    
+    async def recent(self, user_id: str, limit: int, since: Optional[datetime] = None) -> Optional[List[HealthData]]:
+        """A user's newest readings, newest first, or None when the caller must query the database"""
+        if not self.enabled or limit > self.capacity:
+            return None
+        
+        with self._lock:
+            ring = self._windows.get(user_id)
+            if ring is not None:
+                self._windows.move_to_end(user_id)
+                rows = ring.newest(limit, since)
+        if ring is None:
+            ring = await self._load(user_id)
+            with self._lock:
+                rows = ring.newest(limit, since)
+        
+        if rows is None:
+            hot_cache_misses.inc()
+            return None
+        hot_cache_hits.inc()
+        return [HealthData(user_id=user_id, **row) for row in rows]
+
+hot_cache = HotWindowCache(
+    capacity=settings.HOT_CACHE_CAPACITY,
+    max_bytes=settings.HOT_CACHE_MAX_BYTES
+)
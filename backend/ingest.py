@@ -0,0 +1,269 @@
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import asyncio
+import numpy as np
+import logging
+import time
+from .config import settings
+from .database import HealthData, Alert, writer_engine
+from .metrics import Gauge, Histogram
+from .models import HealthDataCreate
+from .ml_service import inference_executor, prediction_batcher
+from .rollups import apply_rollups
+from .hot_cache import hot_cache
+from .dashboard_cache import dashboard_cache
+from .sketches import sketch_store
+from .tasks import TaskSet
+
+logger = logging.getLogger(__name__)
+
+def build_anomaly_alert(reading: HealthDataCreate, confidence: float) -> Dict[str, Any]:
+    """Build the alert row raised for an anomalous reading"""
+    return {
+        'user_id': reading.user_id,
+        'alert_type': "anomaly",
+        'message': f"Anomaly detected: HR={reading.heart_rate}, SpO2={reading.blood_oxygen}%",
+        'severity': "high" if confidence > 80 else "medium"
+    }
+
+def build_reading_row(
+    reading: HealthDataCreate,
+    anomaly_score: float,
+    is_anomaly: bool,
+    now: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """Build the health_data row for a scored reading"""
+    now = now or datetime.utcnow()
+    timestamp = reading.timestamp or now
+    if timestamp.tzinfo is not None:
+        # Stored timestamps are naive UTC, like datetime.utcnow()
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return {
+        'user_id': reading.user_id,
+        'timestamp': timestamp,
+        'heart_rate': reading.heart_rate,
+        'blood_oxygen': reading.blood_oxygen,
+        'temperature': reading.temperature,
+        'blood_pressure_systolic': reading.blood_pressure_systolic,
+        'blood_pressure_diastolic': reading.blood_pressure_diastolic,
+        'activity_level': reading.activity_level,
+        'anomaly_score': anomaly_score,
+        'is_anomaly': is_anomaly,
+        'created_at': now
+    }
+
+async def score_readings(readings: Sequence[HealthDataCreate]) -> Dict[str, np.ndarray]:
+    """Score a batch of readings with one vectorized model call in the inference pool"""
+    heart_rates = np.fromiter((r.heart_rate for r in readings), dtype=np.float64, count=len(readings))
+    blood_oxygens = np.fromiter((r.blood_oxygen for r in readings), dtype=np.float64, count=len(readings))
+    return await inference_executor.predict_many(heart_rates, blood_oxygens)
+
+def build_rows(
+    readings: Sequence[HealthDataCreate],
+    scores: Dict[str, np.ndarray]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Turn scored readings into health_data and alerts insert rows"""
+    now = datetime.utcnow()
+    anomaly_scores = scores['anomaly_score'].tolist()
+    is_anomaly = scores['is_anomaly'].tolist()
+    confidence = scores['confidence'].tolist()
+    
+    reading_rows = []
+    alert_rows = []
+    for i, reading in enumerate(readings):
+        reading_rows.append(build_reading_row(reading, anomaly_scores[i], is_anomaly[i], now))
+        if is_anomaly[i]:
+            alert_rows.append(build_anomaly_alert(reading, confidence[i]))
+    
+    return reading_rows, alert_rows
+
+def publish_committed(reading_rows: List[Dict[str, Any]]):
+    """Let the read caches know about readings (and their alerts) that were just committed"""
+    hot_cache.push(reading_rows)
+    dashboard_cache.invalidate(row['user_id'] for row in reading_rows)
+    sketch_store.add(reading_rows)
+
+def bulk_insert_readings(
+    db: Session,
+    reading_rows: List[Dict[str, Any]],
+    alert_rows: List[Dict[str, Any]]
+):
+    """Insert readings, their alerts and the rollup updates in a single transaction"""
+    try:
+        ids = []
+        if reading_rows:
+            ids = db.execute(
+                insert(HealthData).returning(HealthData.id, sort_by_parameter_order=True),
+                reading_rows
+            ).scalars().all()
+            apply_rollups(db, reading_rows)
+        if alert_rows:
+            db.execute(insert(Alert), alert_rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    
+    publish_committed([{**row, 'id': row_id} for row, row_id in zip(reading_rows, ids)])
+
+async def ingest_reading(reading: HealthDataCreate) -> Tuple[HealthData, Dict[str, Any]]:
+    """Score a single reading and persist it (and its alert) through the group commit"""
+    prediction = await prediction_batcher.predict(reading.heart_rate, reading.blood_oxygen)
+    
+    reading_row = build_reading_row(reading, prediction['anomaly_score'], prediction['is_anomaly'])
+    alert_row = None
+    if prediction['is_anomaly']:
+        alert_row = build_anomaly_alert(reading, prediction['confidence'])
+    
+    db_reading = await write_coalescer.submit(reading_row, alert_row)
+    return db_reading, prediction
+
+async def ingest_readings(readings: Sequence[HealthDataCreate]) -> Dict[str, int]:
+    """Score and persist a chunk of readings, returning its counts"""
+    if not readings:
+        return {'inserted': 0, 'anomaly_count': 0, 'alerts_created': 0}
+    
+    scores = await score_readings(readings)
+    reading_rows, alert_rows = build_rows(readings, scores)
+    await write_coalescer.write_rows(reading_rows, alert_rows)
+    
+    return {
+        'inserted': len(reading_rows),
+        'anomaly_count': int(scores['is_anomaly'].sum()),
+        'alerts_created': len(alert_rows)
+    }
+
+group_size_histogram = Histogram(
+    "lifecare_ingest_group_size",
+    "Readings committed per group commit",
+    buckets=[1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+)
+commit_latency_histogram = Histogram(
+    "lifecare_ingest_commit_seconds",
+    "Time spent writing and committing one group",
+    buckets=[0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0]
+)
+ingest_pending = Gauge(
+    "lifecare_ingest_pending_readings",
+    "Readings waiting for the next group commit"
+)
+
+class WriteCoalescer:
+    """Group-commits readings from concurrent requests.
+    
+    Each submit() waits until the group holding its reading has been
+    committed, so a request is only acknowledged once its data is durable
+    (with the default 'durable' SQLite profile; 'throughput' may lose the
+    last commits on power loss).
+    A group is flushed after max_delay_ms or once max_rows readings are
+    waiting. All writes go through a single writer thread that owns the
+    writer engine's connection.
+    """
+    
+    def __init__(self, max_delay_ms: float = 5.0, max_rows: int = 500):
+        self.max_delay = max_delay_ms / 1000
+        self.max_rows = max_rows
+        self._pending: List[Tuple[Dict[str, Any], Optional[Dict[str, Any]], asyncio.Future]] = []
+        self._timer = None
+        self._commits = TaskSet("group commit")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-writer")
+        self._connection = None
+    
+    async def submit(self, reading_row: Dict[str, Any], alert_row: Optional[Dict[str, Any]] = None) -> HealthData:
+        """Queue a reading (and its alert) and wait until its group is committed"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((reading_row, alert_row, future))
+        ingest_pending.set(len(self._pending))
+        
+        if len(self._pending) >= self.max_rows:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        
+        return await future
+    
+    async def write_rows(self, reading_rows: List[Dict[str, Any]], alert_rows: List[Dict[str, Any]]):
+        """Write an already assembled batch in one transaction on the writer thread"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._writer, self._write_rows, reading_rows, alert_rows)
+    
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        group, self._pending = self._pending, []
+        ingest_pending.set(0)
+        if group:
+            self._commits.spawn(self._commit_group(group))
+    
+    async def _commit_group(self, group):
+        loop = asyncio.get_running_loop()
+        try:
+            readings = await loop.run_in_executor(self._writer, self._write_group, group)
+        except Exception as e:
+            logger.error(f"Group commit of {len(group)} readings failed: {e}")
+            for _, _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, _, future), reading in zip(group, readings):
+            if not future.done():
+                future.set_result(reading)
+    
+    def _session(self, **kwargs) -> Session:
+        # Only ever called on the writer thread
+        if self._connection is None or self._connection.closed:
+            self._connection = writer_engine.connect()
+        return Session(bind=self._connection, **kwargs)
+    
+    def _write_group(self, group) -> List[HealthData]:
+        started = time.perf_counter()
+        db = self._session(expire_on_commit=False)
+        try:
+            readings = [HealthData(**reading_row) for reading_row, _, _ in group]
+            db.add_all(readings)
+            db.add_all([Alert(**alert_row) for _, alert_row, _ in group if alert_row])
+            apply_rollups(db, [reading_row for reading_row, _, _ in group])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        
+        publish_committed([{**reading_row, 'id': reading.id} for (reading_row, _, _), reading in zip(group, readings)])
+        
+        group_size_histogram.observe(len(group))
+        commit_latency_histogram.observe(time.perf_counter() - started)
+        return readings
+    
+    def _write_rows(self, reading_rows, alert_rows):
+        started = time.perf_counter()
+        db = self._session()
+        try:
+            bulk_insert_readings(db, reading_rows, alert_rows)
+        finally:
+            db.close()
+        
+        group_size_histogram.observe(len(reading_rows))
+        commit_latency_histogram.observe(time.perf_counter() - started)
+    
+    def _close_connection(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+    
+    def shutdown(self):
+        self._writer.submit(self._close_connection).result()
+        self._writer.shutdown(wait=True)
+
+write_coalescer = WriteCoalescer(
+    max_delay_ms=settings.INGEST_GROUP_COMMIT_MS,
+    max_rows=settings.INGEST_GROUP_COMMIT_MAX_ROWS
+)
@@ -1,21 +1,29 @@
 from fastapi import FastAPI, WebSocket, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 import logging
 import os
 from .config import settings
-from .database import Base, engine
+from .database import engine, async_engine, storage_maintenance
+from .migrations import run_migrations
 from .routers import auth, health, alerts
 from .websocket import handle_websocket
-from .ml_service import ml_service
+from .ml_service import ml_service, inference_executor
+from .ingest import write_coalescer
+from .metrics import generate_latest
+from .pagination import NEXT_CURSOR_HEADER
+from .archive import retention_job
+from .sketches import sketch_store
+from .passwords import password_hasher
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Create database tables and apply pending schema migrations; data backfills
+# on a database that already has readings are left to `python -m backend.migrations`
+run_migrations(engine, backfills=False)
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -32,6 +40,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # Include routers
@@ -53,6 +62,12 @@ async def health_check():
         "version": "1.0.0"
     }
 
+# Prometheus metrics endpoint
+if settings.ENABLE_METRICS:
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        return generate_latest()
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -69,11 +84,23 @@ async def startup_event():
     logger.info("Initializing ML service...")
     # ML service is already initialized when imported
     logger.info("ML service ready")
+    if storage_maintenance is not None:
+        storage_maintenance.start()
+    retention_job.start()
+    sketch_store.start()
 
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info(f"Shutting down {settings.PROJECT_NAME}")
+    if storage_maintenance is not None:
+        await storage_maintenance.stop()
+    await retention_job.stop()
+    inference_executor.shutdown()
+    write_coalescer.shutdown()
+    password_hasher.shutdown()
+    await sketch_store.stop()
+    await async_engine.dispose()
 
 if __name__ == "__main__":
     import uvicorn
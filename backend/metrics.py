@@ -0,0 +1,97 @@
+from abc import ABC, abstractmethod
+from typing import List, Sequence
+import bisect
+import threading
+
+class _Metric(ABC):
+    metric_type = "untyped"
+    
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+    
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Exposition lines for the metric's current value(s)"""
+    
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}"
+        ]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    metric_type = "counter"
+    
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self.value = 0.0
+    
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+    
+    def samples(self) -> List[str]:
+        return [f"{self.name} {self.value}"]
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+    
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self.value = 0.0
+    
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+    
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+    
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+    
+    def samples(self) -> List[str]:
+        return [f"{self.name} {self.value}"]
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+    
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float]):
+        super().__init__(name, documentation)
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+    
+    def samples(self) -> List[str]:
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+REGISTRY: List[_Metric] = []
+
+def generate_latest() -> str:
+    """Render every registered metric in the Prometheus text format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
@@ -0,0 +1,158 @@
+from sqlalchemy import Index, Table, select, text
+from sqlalchemy.engine import Engine
+from typing import Callable, List, Tuple
+import argparse
+import logging
+from .archive import reading_archive
+from .backfills import BACKFILL_VERSIONS, migration_metadata, schema_migrations
+from .database import Base, HealthData, Alert
+from .rollups import rebuild_rollups
+from .sketches import rebuild_sketches
+
+logger = logging.getLogger(__name__)
+
+def create_index_online(engine: Engine, index: Index):
+    """Create an index if it is missing without taking the table offline"""
+    if engine.dialect.name == "postgresql":
+        # CONCURRENTLY keeps the table writable but cannot run inside a transaction
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} ON {index.table.name} "
+                f"({', '.join(column.name for column in index.columns)})"
+            ))
+    else:
+        # SQLite builds the index under the write lock; in WAL mode readers keep going
+        with engine.begin() as conn:
+            index.create(conn, checkfirst=True)
+
+def _create_indexes(*indexes: Index) -> Callable[[Engine], None]:
+    def upgrade(engine: Engine):
+        for index in indexes:
+            create_index_online(engine, index)
+    return upgrade
+
+def _index(table: Table, name: str) -> Index:
+    return next(index for index in table.indexes if index.name == name)
+
+# Append only; a deployed version number must never be reused
+MIGRATIONS: List[Tuple[int, str, Callable[[Engine], None]]] = [
+    (1, "Composite time-series indexes for readings and alerts", _create_indexes(
+        _index(HealthData.__table__, 'ix_health_data_user_id_timestamp'),
+        _index(HealthData.__table__, 'ix_health_data_user_id_is_anomaly_timestamp'),
+        _index(Alert.__table__, 'ix_alerts_user_id_is_read_created_at'),
+    )),
+    (2, "Backfill hourly and daily rollups from existing readings", rebuild_rollups),
+    (3, "Alerts index for keyset pagination", _create_indexes(
+        _index(Alert.__table__, 'ix_alerts_user_id_created_at'),
+    )),
+    (4, "Backfill hourly population quantile sketches", rebuild_sketches),
+]
+
+def applied_versions(engine: Engine) -> set:
+    with engine.connect() as conn:
+        return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+def has_readings(engine: Engine) -> bool:
+    with engine.connect() as conn:
+        if conn.execute(select(HealthData.id).limit(1)).first() is not None:
+            return True
+    return bool(reading_archive.users())
+
+def run_migrations(engine: Engine, backfills: bool = True):
+    """Create missing tables, then apply every pending migration in order.
+    
+    With backfills=False, backfill migrations are still applied to an empty
+    database (where they cost nothing) but otherwise stay pending until
+    `python -m backend.migrations` runs them, since on a database that
+    already holds readings they can run for a long time. Until then the
+    readers of the rollups and sketches do not trust those tables (see
+    backend.backfills).
+    """
+    Base.metadata.create_all(bind=engine)
+    migration_metadata.create_all(bind=engine)
+    
+    applied = applied_versions(engine)
+    defer_backfills = not backfills and has_readings(engine)
+    for version, description, upgrade in MIGRATIONS:
+        if version in applied:
+            continue
+        if defer_backfills and version in BACKFILL_VERSIONS:
+            logger.warning(
+                f"Backfill migration {version} is pending ({description}); "
+                f"its readers fall back or refuse until `python -m backend.migrations` applies it"
+            )
+            continue
+        logger.info(f"Applying migration {version}: {description}")
+        upgrade(engine)
+        with engine.begin() as conn:
+            conn.execute(schema_migrations.insert().values(version=version, description=description))
+
+# Hot queries and the index each one is expected to use
+HOT_QUERY_PLANS = [
+    (
+        "readings page",
+        "SELECT * FROM health_data WHERE user_id = 'u' ORDER BY timestamp DESC LIMIT 100",
+        "ix_health_data_user_id_timestamp"
+    ),
+    (
+        "readings window",
+        "SELECT COUNT(id), AVG(heart_rate), MAX(timestamp) FROM health_data "
+        "WHERE user_id = 'u' AND timestamp >= '2024-01-01'",
+        "ix_health_data_user_id_timestamp"
+    ),
+    (
+        "anomalies window",
+        "SELECT * FROM health_data WHERE user_id = 'u' AND is_anomaly = 1 "
+        "AND timestamp >= '2024-01-01' ORDER BY timestamp DESC",
+        "ix_health_data_user_id_is_anomaly_timestamp"
+    ),
+    (
+        "unread alerts",
+        "SELECT * FROM alerts WHERE user_id = 'u' AND is_read = 0 ORDER BY created_at DESC LIMIT 50",
+        "ix_alerts_user_id_is_read_created_at"
+    ),
+    (
+        "readings keyset page",
+        "SELECT * FROM health_data WHERE user_id = 'u' AND (timestamp < '2024-01-01' "
+        "OR (timestamp = '2024-01-01' AND id < 10)) ORDER BY timestamp DESC, id DESC LIMIT 100",
+        "ix_health_data_user_id_timestamp"
+    ),
+    (
+        "alerts keyset page",
+        "SELECT * FROM alerts WHERE user_id = 'u' AND (created_at < '2024-01-01' "
+        "OR (created_at = '2024-01-01' AND id < 10)) ORDER BY created_at DESC, id DESC LIMIT 50",
+        "ix_alerts_user_id_created_at"
+    ),
+    (
+        "refresh token lookup",
+        "SELECT * FROM refresh_tokens WHERE token_digest = 'd'",
+        "ix_refresh_tokens_token_digest"
+    ),
+]
+
+def check_query_plans(engine: Engine) -> List[str]:
+    """Return a description of every hot query whose SQLite plan misses its index"""
+    problems = []
+    with engine.connect() as conn:
+        for name, sql, index_name in HOT_QUERY_PLANS:
+            plan = " | ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+            if index_name not in plan:
+                problems.append(f"{name}: expected {index_name}, got plan '{plan}'")
+    return problems
+
+if __name__ == "__main__":
+    from .database import engine
+    
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations")
+    parser.add_argument("--check-plans", action="store_true", help="verify hot queries use their indexes (SQLite)")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    run_migrations(engine)
+    if args.check_plans:
+        problems = check_query_plans(engine)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            raise SystemExit(1)
+        print("✅ All hot queries use their indexes")
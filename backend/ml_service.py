@@ -4,9 +4,17 @@ import pandas as pd
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 from typing import Tuple, List, Dict, Any
+import asyncio
 import logging
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
 import os
+from .config import settings
+from .metrics import Gauge, Histogram
+from .compiled_forest import CompiledIsolationForest
+from .score_grid import AnomalyScoreGrid
+from .tasks import TaskSet
 
 logger = logging.getLogger(__name__)
 
@@ -15,8 +23,18 @@ class HealthAnomalyDetector:
         self.model_path = model_path
         self.model = None
         self.scaler = None
+        self.compiled = None
+        self.grid = None
         self.feature_names = ['heart_rate', 'blood_oxygen']
         self.load_or_create_model()
+        if settings.ML_SCORING_MODE in ("compiled", "grid"):
+            self.load_or_compile_model()
+        if settings.ML_SCORING_MODE == "grid":
+            self.build_score_grid(settings.ML_GRID_RESOLUTION)
+    
+    @property
+    def compiled_path(self) -> str:
+        return str(Path(self.model_path).with_suffix('.npz'))
     
     def load_or_create_model(self):
         """Load existing model or create a new one"""
@@ -76,6 +94,46 @@ class HealthAnomalyDetector:
         self.save_model()
         logger.info("New model created and trained successfully")
     
+    def load_or_compile_model(self):
+        """Load the exported numpy forest, or export it from the sklearn model"""
+        try:
+            compiled_path = self.compiled_path
+            if (os.path.exists(compiled_path)
+                    and os.path.getmtime(compiled_path) >= os.path.getmtime(self.model_path)):
+                compiled = CompiledIsolationForest.load(compiled_path)
+            else:
+                compiled = self.export_compiled()
+            
+            # Check agreement with sklearn over the accepted input range
+            hr, spo2 = np.meshgrid(np.linspace(30, 220, 96), np.linspace(70, 100, 32))
+            X_check = np.column_stack([hr.ravel(), spo2.ravel()])
+            max_error, mismatches = compiled.max_abs_error(self.model, self.scaler, X_check)
+            if max_error > 1e-9 or mismatches:
+                logger.warning(
+                    f"Compiled forest disagrees with sklearn (max error {max_error:.3g}, "
+                    f"{mismatches} label mismatches), falling back to sklearn scoring"
+                )
+                return
+            
+            self.compiled = compiled
+            logger.info("Compiled forest evaluator ready")
+        except Exception as e:
+            logger.error(f"Error compiling model: {e}")
+    
+    def build_score_grid(self, resolution: int):
+        """Precompute the score surface so scoring becomes a table lookup"""
+        try:
+            self.grid = AnomalyScoreGrid.build(self.exact_score, resolution)
+        except Exception as e:
+            logger.error(f"Error building score grid: {e}")
+    
+    def export_compiled(self) -> CompiledIsolationForest:
+        """Flatten the fitted forest into numpy arrays and save them next to the model"""
+        compiled = CompiledIsolationForest.from_sklearn(self.model, self.scaler)
+        compiled.save(self.compiled_path)
+        logger.info(f"Compiled forest saved to {self.compiled_path}")
+        return compiled
+    
     def save_model(self):
         """Save the model and scaler"""
         os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
@@ -87,40 +145,76 @@ class HealthAnomalyDetector:
         joblib.dump(model_data, self.model_path)
         logger.info(f"Model saved to {self.model_path}")
     
+    def score(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Score an (n, 2) matrix of [heart_rate, blood_oxygen] rows in one pass"""
+        if self.grid is not None:
+            return self.grid.score(X)
+        return self.exact_score(X)
+    
+    def exact_score(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Score with the full model, bypassing the lookup grid"""
+        if self.compiled is not None:
+            return self.compiled.score(X)
+        
+        X_scaled = self.scaler.transform(np.asarray(X, dtype=np.float64))
+        anomaly_scores = self.model.decision_function(X_scaled)
+        # IsolationForest.predict() is decision_function() < 0, so derive the
+        # labels from the scores instead of walking the forest a second time
+        is_anomaly = anomaly_scores < 0
+        return anomaly_scores, is_anomaly
+    
+    def build_prediction(self, heart_rate: float, blood_oxygen: float, anomaly_score: float, is_anomaly: bool) -> Dict[str, Any]:
+        """Build the prediction payload for an already scored reading"""
+        # Calculate confidence (normalized anomaly score)
+        confidence = min(abs(anomaly_score) * 100, 100)
+        
+        # Generate recommendations
+        recommendations = self.generate_recommendations(
+            heart_rate, blood_oxygen, is_anomaly, anomaly_score
+        )
+        
+        return {
+            'anomaly_score': float(anomaly_score),
+            'is_anomaly': bool(is_anomaly),
+            'confidence': float(confidence),
+            'recommendations': recommendations
+        }
+    
     def predict(self, heart_rate: float, blood_oxygen: float) -> Dict[str, Any]:
         """Make prediction for given health metrics"""
         try:
-            # Prepare input data
-            X = np.array([[heart_rate, blood_oxygen]])
-            X_scaled = self.scaler.transform(X)
-            
-            # Get anomaly score and prediction
-            anomaly_score = self.model.decision_function(X_scaled)[0]
-            is_anomaly = self.model.predict(X_scaled)[0] == -1
-            
-            # Calculate confidence (normalized anomaly score)
-            confidence = min(abs(anomaly_score) * 100, 100)
-            
-            # Generate recommendations
-            recommendations = self.generate_recommendations(
-                heart_rate, blood_oxygen, is_anomaly, anomaly_score
+            anomaly_scores, is_anomaly = self.score(np.array([[heart_rate, blood_oxygen]]))
+            return self.build_prediction(
+                heart_rate, blood_oxygen, anomaly_scores[0], is_anomaly[0]
             )
-            
-            return {
-                'anomaly_score': float(anomaly_score),
-                'is_anomaly': bool(is_anomaly),
-                'confidence': float(confidence),
-                'recommendations': recommendations
-            }
         
         except Exception as e:
             logger.error(f"Prediction error: {e}")
-            return {
-                'anomaly_score': 0.0,
-                'is_anomaly': False,
-                'confidence': 0.0,
-                'recommendations': ['Unable to process prediction. Please try again.']
-            }
+            return self.fallback_prediction()
+    
+    def fallback_prediction(self) -> Dict[str, Any]:
+        """Prediction returned when the model cannot score a reading"""
+        return {
+            'anomaly_score': 0.0,
+            'is_anomaly': False,
+            'confidence': 0.0,
+            'recommendations': ['Unable to process prediction. Please try again.']
+        }
+    
+    def predict_many(self, heart_rates: np.ndarray, blood_oxygens: np.ndarray) -> Dict[str, np.ndarray]:
+        """Score many readings with a single vectorized model call"""
+        X = np.column_stack([
+            np.asarray(heart_rates, dtype=np.float64),
+            np.asarray(blood_oxygens, dtype=np.float64)
+        ])
+        anomaly_scores, is_anomaly = self.score(X)
+        confidence = np.minimum(np.abs(anomaly_scores) * 100, 100)
+        
+        return {
+            'anomaly_score': anomaly_scores,
+            'is_anomaly': is_anomaly,
+            'confidence': confidence
+        }
     
     def generate_recommendations(self, hr: float, spo2: float, is_anomaly: bool, score: float) -> List[str]:
         """Generate health recommendations based on readings"""
@@ -159,15 +253,11 @@ class HealthAnomalyDetector:
     def batch_predict(self, data: pd.DataFrame) -> pd.DataFrame:
         """Make predictions for batch data"""
         try:
-            X = data[self.feature_names].values
-            X_scaled = self.scaler.transform(X)
-            
-            anomaly_scores = self.model.decision_function(X_scaled)
-            predictions = self.model.predict(X_scaled)
+            anomaly_scores, is_anomaly = self.score(data[self.feature_names].values)
             
             data = data.copy()
             data['anomaly_score'] = anomaly_scores
-            data['is_anomaly'] = predictions == -1
+            data['is_anomaly'] = is_anomaly
             
             return data
         
@@ -175,5 +265,191 @@ class HealthAnomalyDetector:
             logger.error(f"Batch prediction error: {e}")
             return data
 
+class InferenceTimeoutError(Exception):
+    """Raised when a scoring call waits too long for an inference slot"""
+
+inference_in_flight = Gauge(
+    "lifecare_ml_inference_in_flight",
+    "Scoring calls currently running in the inference pool"
+)
+inference_waiting = Gauge(
+    "lifecare_ml_inference_waiting",
+    "Scoring calls waiting for an inference slot"
+)
+inference_latency_histogram = Histogram(
+    "lifecare_ml_inference_seconds",
+    "Time spent running a scoring call in the inference pool",
+    buckets=[0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5]
+)
+
+def _score_matrix(X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Module level so it can be shipped to a process pool; each worker
+    # process resolves ml_service to its own copy of the model
+    return ml_service.score(X)
+
+def _predict_many(heart_rates: np.ndarray, blood_oxygens: np.ndarray) -> Dict[str, np.ndarray]:
+    return ml_service.predict_many(heart_rates, blood_oxygens)
+
+class InferenceExecutor:
+    """Runs model scoring off the event loop on a bounded worker pool.
+    
+    At most max_concurrency calls run at once; a call that cannot get a slot
+    within queue_timeout seconds fails with InferenceTimeoutError.
+    """
+    
+    def __init__(self, kind: str = "thread", workers: int = 2, max_concurrency: int = 4, queue_timeout: float = 1.0):
+        self.kind = kind
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._pool: Executor = None
+        self._semaphore: asyncio.Semaphore = None
+    
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        return self._pool
+    
+    async def run(self, fn, *args):
+        """Run a module-level scoring function in the pool"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        inference_waiting.inc()
+        acquired = False
+        try:
+            # asyncio.timeout rather than wait_for: on 3.11 wait_for can drop a
+            # permit that was acquired just as the timeout fired
+            async with asyncio.timeout(self.queue_timeout):
+                await self._semaphore.acquire()
+                acquired = True
+        except TimeoutError:
+            if acquired:
+                self._semaphore.release()
+            raise InferenceTimeoutError(f"No inference slot available within {self.queue_timeout}s")
+        except BaseException:
+            if acquired:
+                self._semaphore.release()
+            raise
+        finally:
+            inference_waiting.dec()
+        
+        inference_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), fn, *args)
+        finally:
+            inference_latency_histogram.observe(time.perf_counter() - started)
+            inference_in_flight.dec()
+            self._semaphore.release()
+    
+    async def score(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return await self.run(_score_matrix, X)
+    
+    async def predict_many(self, heart_rates: np.ndarray, blood_oxygens: np.ndarray) -> Dict[str, np.ndarray]:
+        return await self.run(_predict_many, heart_rates, blood_oxygens)
+    
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+batch_queue_depth = Gauge(
+    "lifecare_ml_batch_queue_depth",
+    "Predictions waiting for the next micro-batch"
+)
+batch_size_histogram = Histogram(
+    "lifecare_ml_batch_size",
+    "Number of readings scored per micro-batch",
+    buckets=[1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+)
+batch_wait_histogram = Histogram(
+    "lifecare_ml_batch_wait_seconds",
+    "Time a prediction spent queued before its batch was scored",
+    buckets=[0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1]
+)
+
+class PredictionBatcher:
+    """Coalesces concurrent single-reading predictions into one model call.
+    
+    Callers await predict(); requests arriving within max_wait_ms of the first
+    queued one (or until max_batch_size is reached) are scored as one matrix.
+    """
+    
+    def __init__(self, detector: HealthAnomalyDetector, executor: InferenceExecutor, max_batch_size: int = 256, max_wait_ms: float = 2.0):
+        self.detector = detector
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[float, float, float, asyncio.Future]] = []
+        self._timer = None
+        self._batches = TaskSet("prediction batch")
+    
+    async def predict(self, heart_rate: float, blood_oxygen: float) -> Dict[str, Any]:
+        """Queue a reading for the next micro-batch and wait for its prediction"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((heart_rate, blood_oxygen, time.perf_counter(), future))
+        batch_queue_depth.set(len(self._pending))
+        
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        
+        return await future
+    
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        batch, self._pending = self._pending, []
+        batch_queue_depth.set(0)
+        if batch:
+            self._batches.spawn(self._score_batch(batch))
+    
+    async def _score_batch(self, batch: List[Tuple[float, float, float, asyncio.Future]]):
+        now = time.perf_counter()
+        batch_size_histogram.observe(len(batch))
+        for _, _, queued_at, _ in batch:
+            batch_wait_histogram.observe(now - queued_at)
+        
+        try:
+            X = np.array([(hr, spo2) for hr, spo2, _, _ in batch], dtype=np.float64)
+            anomaly_scores, is_anomaly = await self.executor.score(X)
+            results = [
+                self.detector.build_prediction(hr, spo2, anomaly_scores[i], is_anomaly[i])
+                for i, (hr, spo2, _, _) in enumerate(batch)
+            ]
+        except InferenceTimeoutError as e:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        except Exception as e:
+            logger.error(f"Batch prediction error: {e}")
+            results = [self.detector.fallback_prediction() for _ in batch]
+        
+        for (_, _, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
 # Global instance
-ml_service = HealthAnomalyDetector()
\ No newline at end of file
+ml_service = HealthAnomalyDetector(settings.MODEL_PATH)
+inference_executor = InferenceExecutor(
+    kind=settings.ML_EXECUTOR,
+    workers=settings.ML_EXECUTOR_WORKERS,
+    max_concurrency=settings.ML_MAX_CONCURRENCY,
+    queue_timeout=settings.ML_QUEUE_TIMEOUT_SECONDS
+)
+prediction_batcher = PredictionBatcher(
+    ml_service,
+    inference_executor,
+    max_batch_size=settings.ML_BATCH_MAX_SIZE,
+    max_wait_ms=settings.ML_BATCH_WINDOW_MS
+)
\ No newline at end of file
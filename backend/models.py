@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Optional, List
 from enum import Enum
 
 class AlertSeverity(str, Enum):
@@ -23,6 +23,18 @@ class HealthDataCreate(BaseModel):
     blood_pressure_systolic: Optional[float] = Field(None, ge=70, le=250)
     blood_pressure_diastolic: Optional[float] = Field(None, ge=40, le=150)
     activity_level: Optional[str] = Field(None, description="low, moderate, high")
+    timestamp: Optional[datetime] = Field(None, description="Device sample time, defaults to server receive time")
+
+MAX_BATCH_READINGS = 10000
+
+class HealthDataBatchCreate(BaseModel):
+    readings: List[HealthDataCreate] = Field(..., min_items=1, max_items=MAX_BATCH_READINGS)
+
+class HealthDataBatchResponse(BaseModel):
+    received: int
+    inserted: int
+    anomaly_count: int
+    alerts_created: int
 
 class HealthDataResponse(BaseModel):
     id: int
@@ -39,6 +51,7 @@ class HealthDataResponse(BaseModel):
     created_at: datetime
 
     class Config:
+        orm_mode = True
         from_attributes = True
 
 class UserCreate(BaseModel):
@@ -62,8 +75,12 @@ class UserResponse(BaseModel):
     created_at: datetime
 
     class Config:
+        orm_mode = True
         from_attributes = True
 
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
 class AlertCreate(BaseModel):
     user_id: str
     alert_type: AlertType
@@ -80,6 +97,7 @@ class AlertResponse(BaseModel):
     created_at: datetime
 
     class Config:
+        orm_mode = True
         from_attributes = True
 
 class HealthMetrics(BaseModel):
@@ -88,6 +106,40 @@ class HealthMetrics(BaseModel):
     anomaly_count: int
     total_readings: int
     last_reading_time: Optional[datetime]
+    # Only filled in when extended metrics are requested
+    min_heart_rate: Optional[float] = None
+    max_heart_rate: Optional[float] = None
+    std_heart_rate: Optional[float] = None
+    min_blood_oxygen: Optional[float] = None
+    max_blood_oxygen: Optional[float] = None
+    std_blood_oxygen: Optional[float] = None
+
+MAX_SERIES_POINTS = 5000
+
+class DownsampledSeries(BaseModel):
+    user_id: str
+    metric: str
+    method: str
+    start: datetime
+    end: datetime
+    total_readings: int
+    # Width of each bucket; None when LTTB picked individual raw readings
+    bucket_seconds: Optional[float] = None
+    timestamps: List[datetime]
+    # LTTB: the selected readings; minmax: the mean of each bucket
+    values: List[float]
+    min_values: Optional[List[float]] = None
+    max_values: Optional[List[float]] = None
+
+class MetricQuantiles(BaseModel):
+    count: int
+    # Keyed by percentile label, e.g. "p50", "p99.9"
+    quantiles: Dict[str, Optional[float]]
+
+class PopulationQuantiles(BaseModel):
+    start: datetime
+    end: datetime
+    metrics: Dict[str, MetricQuantiles]
 
 class PredictionRequest(BaseModel):
     heart_rate: float
@@ -0,0 +1,47 @@
+from fastapi import HTTPException, Response, status
+from sqlalchemy import Select, and_, or_
+from datetime import datetime
+from typing import Any, Optional, Sequence, Tuple
+import base64
+import binascii
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """Opaque cursor pointing just past the row with this (timestamp, id)"""
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def keyset_page(query: Select, timestamp_column, id_column, cursor: Optional[str], skip: int, limit: int) -> Select:
+    """Order newest first and page by (timestamp, id) after the cursor, or by offset without one.
+    
+    Seeking past the cursor walks the (…, timestamp) index directly, so a
+    deep page costs the same as the first one; skip is kept for old clients.
+    """
+    query = query.order_by(timestamp_column.desc(), id_column.desc())
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        query = query.where(or_(
+            timestamp_column < timestamp,
+            and_(timestamp_column == timestamp, id_column < row_id)
+        ))
+    elif skip:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+def set_next_cursor(response: Response, rows: Sequence[Any], limit: int, timestamp_attr: str):
+    """Advertise the cursor for the following page when this one came back full"""
+    if rows and len(rows) == limit:
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(getattr(last, timestamp_attr), last.id)
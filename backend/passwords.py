@@ -0,0 +1,88 @@
+from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+import asyncio
+import time
+from .config import settings
+from .metrics import Counter, Gauge, Histogram
+
+# Hashes made with any other cost are flagged by verify_and_update and replaced at login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS
+)
+
+password_pool_pending = Gauge(
+    "lifecare_password_pool_pending",
+    "Password hash and verify calls running or queued"
+)
+password_pool_rejected = Counter(
+    "lifecare_password_pool_rejected_total",
+    "Password operations refused because the pool queue was full"
+)
+password_pool_latency_histogram = Histogram(
+    "lifecare_password_pool_seconds",
+    "Time from submitting a password operation to its result",
+    buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]
+)
+
+class PasswordPoolBusyError(Exception):
+    """Raised when the password pool already has max_queue operations waiting"""
+
+class PasswordHasher:
+    """Runs bcrypt off the event loop on its own bounded thread pool.
+    
+    bcrypt releases the GIL, so workers hash in parallel without stalling
+    ingest or WebSockets. Once workers + max_queue operations are pending a
+    new one fails at once with PasswordPoolBusyError instead of queueing.
+    """
+    
+    def __init__(self, context: CryptContext, workers: int = 2, max_queue: int = 32):
+        self.context = context
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool: ThreadPoolExecutor = None
+        self._pending = 0
+    
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password")
+        return self._pool
+    
+    async def run(self, fn, *args):
+        # Only the event loop thread touches _pending, so no lock is needed
+        if self._pending >= self.workers + self.max_queue:
+            password_pool_rejected.inc()
+            raise PasswordPoolBusyError(f"{self._pending} password operations already pending")
+        
+        self._pending += 1
+        password_pool_pending.set(self._pending)
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), fn, *args)
+        finally:
+            password_pool_latency_histogram.observe(time.perf_counter() - started)
+            self._pending -= 1
+            password_pool_pending.set(self._pending)
+    
+    async def hash(self, password: str) -> str:
+        return await self.run(self.context.hash, password)
+    
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """(valid, new_hash); new_hash is set when the stored hash uses an outdated cost"""
+        return await self.run(self.context.verify_and_update, password, hashed_password)
+    
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+password_hasher = PasswordHasher(
+    pwd_context,
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE
+)
@@ -0,0 +1,93 @@
+from sqlalchemy import select, update, delete, or_
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from datetime import datetime, timedelta
+import hashlib
+import hmac
+import secrets
+from .config import settings
+from .database import RefreshToken
+
+class InvalidRefreshTokenError(Exception):
+    """Raised when a refresh token is unknown, expired, revoked or already spent"""
+
+def refresh_token_digest(token: str) -> str:
+    """Keyed digest stored in place of the token, so a leaked table cannot be replayed"""
+    return hmac.new(settings.SECRET_KEY.encode(), token.encode(), hashlib.sha256).hexdigest()
+
+def issue_refresh_token(db: AsyncSession, user_id: str, family_id: Optional[str] = None) -> str:
+    """Add a new refresh token to the session (the caller commits) and return it"""
+    token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    db.add(RefreshToken(
+        token_digest=refresh_token_digest(token),
+        user_id=user_id,
+        family_id=family_id or secrets.token_hex(16),
+        created_at=now,
+        expires_at=now + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    ))
+    return token
+
+async def revoke_refresh_family(db: AsyncSession, family_id: str):
+    await db.execute(update(RefreshToken).where(
+        RefreshToken.family_id == family_id,
+        RefreshToken.revoked_at.is_(None)
+    ).values(revoked_at=datetime.utcnow()))
+
+async def spend_refresh_token(db: AsyncSession, token: str) -> RefreshToken:
+    """Mark a refresh token used and return it, ready to be rotated.
+    
+    A token can be spent once. Presenting an already spent token means it
+    was copied, so every token descended from the same login is revoked.
+    """
+    result = await db.execute(select(RefreshToken).where(
+        RefreshToken.token_digest == refresh_token_digest(token)
+    ))
+    record = result.scalars().first()
+    if record is None:
+        raise InvalidRefreshTokenError("Unknown refresh token")
+    
+    now = datetime.utcnow()
+    if record.expires_at <= now:
+        raise InvalidRefreshTokenError("Refresh token has expired")
+    
+    # Conditional update, so two concurrent refreshes cannot both spend it
+    spent = await db.execute(update(RefreshToken).where(
+        RefreshToken.id == record.id,
+        RefreshToken.revoked_at.is_(None)
+    ).values(revoked_at=now))
+    if spent.rowcount != 1:
+        await revoke_refresh_family(db, record.family_id)
+        await db.commit()
+        raise InvalidRefreshTokenError("Refresh token was already used")
+    return record
+
+async def revoke_refresh_token(db: AsyncSession, token: str) -> bool:
+    """Revoke a refresh token and its whole rotation family; False if it is unknown"""
+    result = await db.execute(select(RefreshToken.family_id).where(
+        RefreshToken.token_digest == refresh_token_digest(token)
+    ))
+    family_id = result.scalar()
+    if family_id is None:
+        return False
+    await revoke_refresh_family(db, family_id)
+    return True
+
+def purge_refresh_tokens(engine: Engine) -> int:
+    """Delete expired tokens and every token of a family with none left usable.
+    
+    Spent tokens of a live family are kept until they expire, so replaying
+    one still revokes the family.
+    """
+    now = datetime.utcnow()
+    live_families = select(RefreshToken.family_id).where(
+        RefreshToken.revoked_at.is_(None),
+        RefreshToken.expires_at > now
+    )
+    with engine.begin() as conn:
+        result = conn.execute(delete(RefreshToken).where(or_(
+            RefreshToken.expires_at <= now,
+            RefreshToken.family_id.not_in(live_families)
+        )))
+    return result.rowcount
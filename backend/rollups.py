@@ -0,0 +1,366 @@
+from sqlalchemy import select, delete, insert, func, case
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import logging
+from .archive import reading_archive
+from .backfills import ROLLUP_BACKFILL, backfill_applied
+from .database import HealthData, HealthRollupHourly, HealthRollupDaily
+from .models import HealthMetrics
+
+logger = logging.getLogger(__name__)
+
+BUCKET_SIZES = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+ROLLUP_TABLES = {'hour': HealthRollupHourly, 'day': HealthRollupDaily}
+
+def bucket_start(moment: datetime, bucket: str) -> datetime:
+    if bucket == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def bucket_ceil(moment: datetime, bucket: str) -> datetime:
+    start = bucket_start(moment, bucket)
+    return start if start == moment else start + BUCKET_SIZES[bucket]
+
+def bucket_expression(dialect: str, bucket: str, column=HealthData.timestamp):
+    """SQL expression truncating a timestamp column to the start of its bucket"""
+    if dialect == "postgresql":
+        return func.date_trunc(bucket, column)
+    # Matches the text format SQLAlchemy stores SQLite DateTime values in, so
+    # truncated values compare and conflict with bound datetimes correctly
+    fmt = '%Y-%m-%d %H:00:00.000000' if bucket == 'hour' else '%Y-%m-%d 00:00:00.000000'
+    return func.strftime(fmt, column)
+
+class Aggregate:
+    """Mergeable summary of a set of readings"""
+    
+    def __init__(self, count=0, anomaly_count=0, hr_sum=0.0, hr_sq_sum=0.0, hr_min=None, hr_max=None,
+                 spo2_sum=0.0, spo2_sq_sum=0.0, spo2_min=None, spo2_max=None, last_timestamp=None):
+        self.count = count or 0
+        self.anomaly_count = anomaly_count or 0
+        self.hr_sum = hr_sum or 0.0
+        self.hr_sq_sum = hr_sq_sum or 0.0
+        self.hr_min = hr_min
+        self.hr_max = hr_max
+        self.spo2_sum = spo2_sum or 0.0
+        self.spo2_sq_sum = spo2_sq_sum or 0.0
+        self.spo2_min = spo2_min
+        self.spo2_max = spo2_max
+        self.last_timestamp = last_timestamp
+    
+    def merge(self, other: "Aggregate") -> "Aggregate":
+        def pick(a, b, fn):
+            return b if a is None else a if b is None else fn(a, b)
+        
+        return Aggregate(
+            count=self.count + other.count,
+            anomaly_count=self.anomaly_count + other.anomaly_count,
+            hr_sum=self.hr_sum + other.hr_sum,
+            hr_sq_sum=self.hr_sq_sum + other.hr_sq_sum,
+            hr_min=pick(self.hr_min, other.hr_min, min),
+            hr_max=pick(self.hr_max, other.hr_max, max),
+            spo2_sum=self.spo2_sum + other.spo2_sum,
+            spo2_sq_sum=self.spo2_sq_sum + other.spo2_sq_sum,
+            spo2_min=pick(self.spo2_min, other.spo2_min, min),
+            spo2_max=pick(self.spo2_max, other.spo2_max, max),
+            last_timestamp=pick(self.last_timestamp, other.last_timestamp, max)
+        )
+    
+    def to_metrics(self, extended: bool = False) -> HealthMetrics:
+        if not self.count:
+            return HealthMetrics(
+                avg_heart_rate=0,
+                avg_blood_oxygen=0,
+                anomaly_count=0,
+                total_readings=0,
+                last_reading_time=None
+            )
+        
+        avg_hr = self.hr_sum / self.count
+        avg_spo2 = self.spo2_sum / self.count
+        metrics = HealthMetrics(
+            avg_heart_rate=round(avg_hr, 1),
+            avg_blood_oxygen=round(avg_spo2, 1),
+            anomaly_count=self.anomaly_count,
+            total_readings=self.count,
+            last_reading_time=self.last_timestamp
+        )
+        if extended:
+            # Population standard deviation from E[x^2] - E[x]^2, clamped against rounding
+            metrics.min_heart_rate = self.hr_min
+            metrics.max_heart_rate = self.hr_max
+            metrics.std_heart_rate = round(max(self.hr_sq_sum / self.count - avg_hr * avg_hr, 0.0) ** 0.5, 2)
+            metrics.min_blood_oxygen = self.spo2_min
+            metrics.max_blood_oxygen = self.spo2_max
+            metrics.std_blood_oxygen = round(max(self.spo2_sq_sum / self.count - avg_spo2 * avg_spo2, 0.0) ** 0.5, 2)
+        return metrics
+
+def _raw_aggregate_columns():
+    return [
+        func.count(HealthData.id),
+        func.sum(case((HealthData.is_anomaly, 1), else_=0)),
+        func.sum(HealthData.heart_rate),
+        func.sum(HealthData.heart_rate * HealthData.heart_rate),
+        func.min(HealthData.heart_rate),
+        func.max(HealthData.heart_rate),
+        func.sum(HealthData.blood_oxygen),
+        func.sum(HealthData.blood_oxygen * HealthData.blood_oxygen),
+        func.min(HealthData.blood_oxygen),
+        func.max(HealthData.blood_oxygen),
+        func.max(HealthData.timestamp)
+    ]
+
+def _rollup_aggregate_columns(table):
+    return [
+        func.sum(table.reading_count),
+        func.sum(table.anomaly_count),
+        func.sum(table.heart_rate_sum),
+        func.sum(table.heart_rate_sq_sum),
+        func.min(table.heart_rate_min),
+        func.max(table.heart_rate_max),
+        func.sum(table.blood_oxygen_sum),
+        func.sum(table.blood_oxygen_sq_sum),
+        func.min(table.blood_oxygen_min),
+        func.max(table.blood_oxygen_max),
+        func.max(table.last_timestamp)
+    ]
+
+async def raw_aggregate(db: AsyncSession, user_id: str, start: datetime, end: Optional[datetime]) -> Aggregate:
+    """Aggregate raw readings in [start, end) with a single query"""
+    query = select(*_raw_aggregate_columns()).where(
+        HealthData.user_id == user_id,
+        HealthData.timestamp >= start
+    )
+    if end is not None:
+        query = query.where(HealthData.timestamp < end)
+    return Aggregate(*(await db.execute(query)).one())
+
+async def rollup_aggregate(db: AsyncSession, bucket: str, user_id: str, start: datetime, end: datetime) -> Aggregate:
+    """Aggregate whole buckets in [start, end) from a rollup table"""
+    table = ROLLUP_TABLES[bucket]
+    query = select(*_rollup_aggregate_columns(table)).where(
+        table.user_id == user_id,
+        table.bucket_start >= start,
+        table.bucket_start < end
+    )
+    return Aggregate(*(await db.execute(query)).one())
+
+def plan_range(start: datetime, end: datetime) -> List[Tuple[Optional[str], datetime, datetime]]:
+    """Split [start, end) into raw edges, hourly rollups and daily rollups"""
+    first_hour = bucket_ceil(start, 'hour')
+    last_hour = bucket_start(end, 'hour')
+    if first_hour >= last_hour:
+        return [(None, start, end)]
+    
+    plan = []
+    if start < first_hour:
+        plan.append((None, start, first_hour))
+    
+    first_day = bucket_ceil(first_hour, 'day')
+    last_day = bucket_start(last_hour, 'day')
+    if first_day < last_day:
+        if first_hour < first_day:
+            plan.append(('hour', first_hour, first_day))
+        plan.append(('day', first_day, last_day))
+        if last_day < last_hour:
+            plan.append(('hour', last_day, last_hour))
+    else:
+        plan.append(('hour', first_hour, last_hour))
+    
+    plan.append((None, last_hour, end))
+    return plan
+
+async def range_aggregate(db: AsyncSession, user_id: str, start: datetime, end: Optional[datetime] = None) -> Aggregate:
+    """Aggregate readings in [start, end), reading whole buckets from the rollups.
+    
+    Rollups keep covering readings after retention archives them, so only the
+    raw edges of the range have to consult the archive as well.
+    """
+    open_ended = end is None
+    if await backfill_applied(db, ROLLUP_BACKFILL):
+        plan = plan_range(start, end or datetime.utcnow())
+    else:
+        # Rollups only hold readings ingested since the upgrade until the backfill runs
+        plan = [(None, start, end or datetime.utcnow())]
+    
+    total = Aggregate()
+    for i, (bucket, lo, hi) in enumerate(plan):
+        if bucket is None:
+            # The trailing raw edge of an open-ended range also picks up
+            # readings with device timestamps slightly in the future
+            if open_ended and i == len(plan) - 1:
+                hi = None
+            total = total.merge(await raw_aggregate(db, user_id, lo, hi))
+            if reading_archive.may_contain(lo):
+                archived = await asyncio.to_thread(reading_archive.aggregate, user_id, lo, hi)
+                total = total.merge(Aggregate(*archived))
+        else:
+            total = total.merge(await rollup_aggregate(db, bucket, user_id, lo, hi))
+    return total
+
+def _as_datetime(value) -> datetime:
+    # SQLite returns the truncated bucket as text
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+async def _raw_buckets(db: AsyncSession, bucket: str, user_id: str, start: datetime, end: datetime) -> List[Any]:
+    """Reading and anomaly counts per bucket in [start, end), straight from the hot and archived readings"""
+    bucket_column = bucket_expression(db.bind.dialect.name, bucket)
+    result = await db.execute(select(
+        bucket_column,
+        func.count(HealthData.id),
+        func.sum(case((HealthData.is_anomaly, 1), else_=0))
+    ).where(
+        HealthData.user_id == user_id,
+        HealthData.timestamp >= start,
+        HealthData.timestamp < end
+    ).group_by(bucket_column))
+    counts = {_as_datetime(key): [count, anomalies or 0] for key, count, anomalies in result.all()}
+    
+    if reading_archive.may_contain(start):
+        timestamps, flags = await asyncio.to_thread(reading_archive.series, user_id, 'is_anomaly', start, end)
+        unit = 'h' if bucket == 'hour' else 'D'
+        for key, flag in zip(timestamps.astype(f'datetime64[{unit}]').astype('datetime64[us]').tolist(), flags.tolist()):
+            entry = counts.setdefault(key, [0, 0])
+            entry[0] += 1
+            entry[1] += int(bool(flag))
+    
+    table = ROLLUP_TABLES[bucket]
+    return [
+        table(user_id=user_id, bucket_start=key, reading_count=count, anomaly_count=anomalies)
+        for key, (count, anomalies) in sorted(counts.items())
+    ]
+
+async def rollup_buckets(db: AsyncSession, bucket: str, user_id: str, start: datetime, end: datetime) -> List[Any]:
+    """Rollup rows for a user whose bucket starts in [start, end)"""
+    if not await backfill_applied(db, ROLLUP_BACKFILL):
+        return await _raw_buckets(db, bucket, user_id, start, end)
+    table = ROLLUP_TABLES[bucket]
+    result = await db.execute(select(table).where(
+        table.user_id == user_id,
+        table.bucket_start >= start,
+        table.bucket_start < end
+    ).order_by(table.bucket_start))
+    return result.scalars().all()
+
+def _accumulate(reading_rows: Iterable[Dict[str, Any]], bucket: str) -> List[Dict[str, Any]]:
+    groups: Dict[Tuple[str, datetime], Dict[str, Any]] = {}
+    for row in reading_rows:
+        key = (row['user_id'], bucket_start(row['timestamp'], bucket))
+        hr, spo2 = row['heart_rate'], row['blood_oxygen']
+        agg = groups.get(key)
+        if agg is None:
+            groups[key] = {
+                'user_id': key[0],
+                'bucket_start': key[1],
+                'reading_count': 1,
+                'anomaly_count': int(bool(row['is_anomaly'])),
+                'heart_rate_sum': hr,
+                'heart_rate_sq_sum': hr * hr,
+                'heart_rate_min': hr,
+                'heart_rate_max': hr,
+                'blood_oxygen_sum': spo2,
+                'blood_oxygen_sq_sum': spo2 * spo2,
+                'blood_oxygen_min': spo2,
+                'blood_oxygen_max': spo2,
+                'last_timestamp': row['timestamp']
+            }
+            continue
+        agg['reading_count'] += 1
+        agg['anomaly_count'] += int(bool(row['is_anomaly']))
+        agg['heart_rate_sum'] += hr
+        agg['heart_rate_sq_sum'] += hr * hr
+        agg['heart_rate_min'] = min(agg['heart_rate_min'], hr)
+        agg['heart_rate_max'] = max(agg['heart_rate_max'], hr)
+        agg['blood_oxygen_sum'] += spo2
+        agg['blood_oxygen_sq_sum'] += spo2 * spo2
+        agg['blood_oxygen_min'] = min(agg['blood_oxygen_min'], spo2)
+        agg['blood_oxygen_max'] = max(agg['blood_oxygen_max'], spo2)
+        agg['last_timestamp'] = max(agg['last_timestamp'], row['timestamp'])
+    return list(groups.values())
+
+def _upsert_statement(dialect: str, table):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        least, greatest = func.least, func.greatest
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        # SQLite's multi-argument min()/max() are scalar functions
+        least, greatest = func.min, func.max
+    else:
+        raise NotImplementedError(f"Rollups are not supported on {dialect}")
+    
+    columns = table.__table__.c
+    stmt = dialect_insert(table.__table__)
+    excluded = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=[columns.user_id, columns.bucket_start],
+        set_={
+            'reading_count': columns.reading_count + excluded.reading_count,
+            'anomaly_count': columns.anomaly_count + excluded.anomaly_count,
+            'heart_rate_sum': columns.heart_rate_sum + excluded.heart_rate_sum,
+            'heart_rate_sq_sum': columns.heart_rate_sq_sum + excluded.heart_rate_sq_sum,
+            'heart_rate_min': least(columns.heart_rate_min, excluded.heart_rate_min),
+            'heart_rate_max': greatest(columns.heart_rate_max, excluded.heart_rate_max),
+            'blood_oxygen_sum': columns.blood_oxygen_sum + excluded.blood_oxygen_sum,
+            'blood_oxygen_sq_sum': columns.blood_oxygen_sq_sum + excluded.blood_oxygen_sq_sum,
+            'blood_oxygen_min': least(columns.blood_oxygen_min, excluded.blood_oxygen_min),
+            'blood_oxygen_max': greatest(columns.blood_oxygen_max, excluded.blood_oxygen_max),
+            'last_timestamp': greatest(columns.last_timestamp, excluded.last_timestamp)
+        }
+    )
+
+def apply_rollups(db: Session, reading_rows: List[Dict[str, Any]]):
+    """Fold newly inserted readings into the hourly and daily rollups.
+    
+    Runs on the caller's session so the rollups commit atomically with the readings.
+    """
+    if not reading_rows:
+        return
+    dialect = db.get_bind().dialect.name
+    for bucket, table in ROLLUP_TABLES.items():
+        db.execute(_upsert_statement(dialect, table), _accumulate(reading_rows, bucket))
+
+def rebuild_rollups(engine: Engine, user_id: Optional[str] = None):
+    """Recompute the rollups from the hot and archived readings, for one user or everyone"""
+    with engine.begin() as conn:
+        for bucket, table in ROLLUP_TABLES.items():
+            clear = delete(table)
+            if user_id:
+                clear = clear.where(table.user_id == user_id)
+            conn.execute(clear)
+            
+            bucket_column = bucket_expression(engine.dialect.name, bucket)
+            source = select(HealthData.user_id, bucket_column, *_raw_aggregate_columns()).group_by(
+                HealthData.user_id, bucket_column
+            )
+            if user_id:
+                source = source.where(HealthData.user_id == user_id)
+            
+            conn.execute(insert(table).from_select([
+                'user_id', 'bucket_start', 'reading_count', 'anomaly_count',
+                'heart_rate_sum', 'heart_rate_sq_sum', 'heart_rate_min', 'heart_rate_max',
+                'blood_oxygen_sum', 'blood_oxygen_sq_sum', 'blood_oxygen_min', 'blood_oxygen_max',
+                'last_timestamp'
+            ], source))
+        
+        # Fold archived readings on top of the buckets rebuilt from health_data
+        with Session(bind=conn) as db:
+            for archived_user in ([user_id] if user_id else reading_archive.users()):
+                for rows in reading_archive.rows(archived_user):
+                    apply_rollups(db, rows)
+    logger.info(f"Rebuilt rollups for {user_id or 'all users'}")
+
+if __name__ == "__main__":
+    from .database import engine
+    
+    parser = argparse.ArgumentParser(description="Maintain the hourly and daily health rollups")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--user-id", help="only rebuild this user's rollups")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    rebuild_rollups(engine, args.user_id)
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from ..database import get_db, Alert, User
+from ..database import get_async_db, Alert, User
 from ..models import AlertCreate, AlertResponse
 from ..auth import get_current_user
+from ..dashboard_cache import dashboard_cache
+from ..pagination import keyset_page, set_next_cursor
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,7 +15,7 @@ router = APIRouter(prefix="/alerts", tags=["alerts"])
 @router.post("/", response_model=AlertResponse)
 async def create_alert(
     alert: AlertCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Create a new alert"""
@@ -25,8 +28,9 @@ async def create_alert(
         )
         
         db.add(db_alert)
-        db.commit()
-        db.refresh(db_alert)
+        await db.commit()
+        await db.refresh(db_alert)
+        dashboard_cache.invalidate([db_alert.user_id])
         
         return db_alert
     
@@ -39,34 +43,38 @@ async def create_alert(
 
 @router.get("/", response_model=List[AlertResponse])
 async def get_alerts(
+    response: Response,
     user_id: Optional[str] = None,
     is_read: Optional[bool] = None,
     limit: int = 50,
     skip: int = 0,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get alerts for a user"""
-    query = db.query(Alert)
+    """Get alerts for a user, newest first; follow X-Next-Cursor for the next page"""
+    query = select(Alert)
     
     if user_id:
-        query = query.filter(Alert.user_id == user_id)
+        query = query.where(Alert.user_id == user_id)
     
     if is_read is not None:
-        query = query.filter(Alert.is_read == is_read)
+        query = query.where(Alert.is_read == is_read)
     
-    alerts = query.order_by(Alert.created_at.desc()).offset(skip).limit(limit).all()
+    result = await db.execute(keyset_page(query, Alert.created_at, Alert.id, cursor, skip, limit))
+    alerts = result.scalars().all()
+    set_next_cursor(response, alerts, limit, 'created_at')
     return alerts
 
 @router.put("/{alert_id}/read")
 async def mark_alert_read(
     alert_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Mark an alert as read"""
     try:
-        alert = db.query(Alert).filter(Alert.id == alert_id).first()
+        alert = await db.get(Alert, alert_id)
         if not alert:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -74,7 +82,8 @@ async def mark_alert_read(
             )
         
         alert.is_read = True
-        db.commit()
+        await db.commit()
+        dashboard_cache.invalidate([alert.user_id])
         
         return {"message": "Alert marked as read"}
     
@@ -90,20 +99,21 @@ async def mark_alert_read(
 @router.delete("/{alert_id}")
 async def delete_alert(
     alert_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Delete an alert"""
     try:
-        alert = db.query(Alert).filter(Alert.id == alert_id).first()
+        alert = await db.get(Alert, alert_id)
         if not alert:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Alert not found"
             )
         
-        db.delete(alert)
-        db.commit()
+        await db.delete(alert)
+        await db.commit()
+        dashboard_cache.invalidate([alert.user_id])
         
         return {"message": "Alert deleted successfully"}
     
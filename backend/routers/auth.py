@@ -1,12 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 from datetime import timedelta
-from ..database import get_db, User
-from ..models import UserCreate, UserResponse
+from ..database import get_async_db, User
+from ..models import UserCreate, UserResponse, RefreshTokenRequest
 from ..auth import (
-    verify_password, get_password_hash, create_access_token,
-    get_current_user
+    create_access_token, get_current_user, invalidate_user,
+    optional_security, revoke_token
+)
+from ..auth_cache import RevocationListFullError
+from ..passwords import password_hasher, PasswordPoolBusyError
+from ..refresh_tokens import (
+    InvalidRefreshTokenError, issue_refresh_token,
+    spend_refresh_token, revoke_refresh_token
 )
 from ..config import settings
 import logging
@@ -14,14 +22,27 @@ import logging
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
+def _issue_tokens(db: AsyncSession, username: str, family_id: Optional[str] = None) -> dict:
+    """Access token plus a refresh token added to the session; the caller commits"""
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": username}, expires_delta=access_token_expires
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": issue_refresh_token(db, username, family_id),
+        "token_type": "bearer"
+    }
+
 @router.post("/register", response_model=UserResponse)
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
     try:
         # Check if user already exists
-        existing_user = db.query(User).filter(
+        result = await db.execute(select(User).where(
             (User.username == user.username) | (User.email == user.email)
-        ).first()
+        ))
+        existing_user = result.scalars().first()
         
         if existing_user:
             raise HTTPException(
@@ -30,7 +51,7 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
             )
         
         # Create new user
-        hashed_password = get_password_hash(user.password)
+        hashed_password = await password_hasher.hash(user.password)
         db_user = User(
             username=user.username,
             email=user.email,
@@ -42,13 +63,20 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
         )
         
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         
         return db_user
     
     except HTTPException:
         raise
+    except PasswordPoolBusyError as e:
+        logger.warning(f"Password pool saturated: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign-in requests, please retry",
+            headers={"Retry-After": "1"}
+        )
     except Exception as e:
         logger.error(f"Registration error: {e}")
         raise HTTPException(
@@ -59,14 +87,20 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
 @router.post("/login")
 async def login_user(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Login user and return access token"""
+    """Login user and return access and refresh tokens"""
     try:
         # Find user
-        user = db.query(User).filter(User.username == form_data.username).first()
+        result = await db.execute(select(User).where(User.username == form_data.username))
+        user = result.scalars().first()
+        
+        if user:
+            valid, new_hash = await password_hasher.verify_and_update(form_data.password, user.hashed_password)
+        else:
+            valid, new_hash = False, None
         
-        if not user or not verify_password(form_data.password, user.hashed_password):
+        if not valid:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect username or password",
@@ -79,20 +113,29 @@ async def login_user(
                 detail="Inactive user"
             )
         
-        # Create access token
-        access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": user.username}, expires_delta=access_token_expires
-        )
+        # Upgrade hashes made with an older bcrypt cost
+        if new_hash:
+            user.hashed_password = new_hash
+        
+        tokens = _issue_tokens(db, user.username)
+        await db.commit()
+        if new_hash:
+            invalidate_user(user.username)
         
         return {
-            "access_token": access_token,
-            "token_type": "bearer",
+            **tokens,
             "user": UserResponse.from_orm(user)
         }
     
     except HTTPException:
         raise
+    except PasswordPoolBusyError as e:
+        logger.warning(f"Password pool saturated: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign-in requests, please retry",
+            headers={"Retry-After": "1"}
+        )
     except Exception as e:
         logger.error(f"Login error: {e}")
         raise HTTPException(
@@ -100,6 +143,67 @@ async def login_user(
             detail="Failed to login"
         )
 
+@router.post("/refresh")
+async def refresh_access_token(body: RefreshTokenRequest, db: AsyncSession = Depends(get_async_db)):
+    """Exchange a refresh token for a new access token and a rotated refresh token"""
+    try:
+        record = await spend_refresh_token(db, body.refresh_token)
+        
+        result = await db.execute(select(User).where(User.username == record.user_id))
+        user = result.scalars().first()
+        if not user or not user.is_active:
+            await db.commit()
+            raise InvalidRefreshTokenError("User is missing or inactive")
+        
+        tokens = _issue_tokens(db, user.username, record.family_id)
+        await db.commit()
+        
+        return tokens
+    
+    except InvalidRefreshTokenError as e:
+        logger.info(f"Refresh rejected: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    except Exception as e:
+        logger.error(f"Token refresh error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to refresh token"
+        )
+
+@router.post("/logout")
+async def logout_user(
+    body: RefreshTokenRequest,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Revoke a refresh token and, when one is sent, the current access token"""
+    try:
+        await revoke_refresh_token(db, body.refresh_token)
+        await db.commit()
+        if credentials is not None:
+            revoke_token(credentials.credentials)
+        
+        return {"message": "Logged out successfully"}
+    
+    except RevocationListFullError as e:
+        # The refresh token is revoked; retrying revokes the access token once entries expire
+        logger.error(f"Access token revocation refused: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Access token could not be revoked, please retry",
+            headers={"Retry-After": "60"}
+        )
+    except Exception as e:
+        logger.error(f"Logout error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to logout"
+        )
+
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
     """Get current user information"""
@@ -109,21 +213,32 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
 async def update_current_user(
     user_update: dict,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update current user information"""
     try:
+        # current_user may come from the user cache, so update a fresh copy
+        user = await db.get(User, current_user.id)
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+        
         # Update allowed fields
         allowed_fields = ['full_name', 'age', 'gender', 'medical_conditions']
         for field, value in user_update.items():
-            if field in allowed_fields and hasattr(current_user, field):
-                setattr(current_user, field, value)
+            if field in allowed_fields and hasattr(user, field):
+                setattr(user, field, value)
         
-        db.commit()
-        db.refresh(current_user)
+        await db.commit()
+        await db.refresh(user)
+        invalidate_user(user.username)
         
-        return current_user
+        return user
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"User update error: {e}")
         raise HTTPException(
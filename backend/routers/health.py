@@ -1,14 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, List, Optional
 from datetime import datetime, timedelta
-from ..database import get_db, HealthData, Alert, User
+import asyncio
+import json
+from ..database import get_async_db, AsyncSessionLocal, HealthData, Alert, User
 from ..models import (
     HealthDataCreate, HealthDataResponse, PredictionRequest, 
-    PredictionResponse, HealthMetrics, DashboardData, AlertResponse
+    PredictionResponse, HealthMetrics, DashboardData, AlertResponse,
+    HealthDataBatchCreate, HealthDataBatchResponse, DownsampledSeries, MAX_SERIES_POINTS,
+    PopulationQuantiles, MetricQuantiles
 )
-from ..ml_service import ml_service
+from ..ml_service import prediction_batcher, InferenceTimeoutError
+from ..ingest import ingest_reading, ingest_readings
+from ..rollups import BUCKET_SIZES, bucket_start, range_aggregate, rollup_buckets
 from ..auth import get_current_user
+from ..pagination import decode_cursor, keyset_page, set_next_cursor
+from ..archive import reading_archive
+from ..backfills import BackfillPendingError
+from ..downsample import downsample_series
+from ..hot_cache import hot_cache
+from ..sketches import sketch_store, SKETCH_METRICS
+from ..dashboard_cache import (
+    CachedResponse, dashboard_cache, etag_matches,
+    dashboard_cache_hits, dashboard_cache_misses, dashboard_cache_not_modified
+)
+from ..config import settings
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,44 +37,21 @@ router = APIRouter(prefix="/health", tags=["health"])
 @router.post("/readings", response_model=HealthDataResponse)
 async def create_health_reading(
     reading: HealthDataCreate,
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Create a new health reading and analyze for anomalies"""
     try:
-        # Get ML prediction
-        prediction = ml_service.predict(reading.heart_rate, reading.blood_oxygen)
-        
-        # Create health data record
-        db_reading = HealthData(
-            user_id=reading.user_id,
-            heart_rate=reading.heart_rate,
-            blood_oxygen=reading.blood_oxygen,
-            temperature=reading.temperature,
-            blood_pressure_systolic=reading.blood_pressure_systolic,
-            blood_pressure_diastolic=reading.blood_pressure_diastolic,
-            activity_level=reading.activity_level,
-            anomaly_score=prediction['anomaly_score'],
-            is_anomaly=prediction['is_anomaly']
-        )
-        
-        db.add(db_reading)
-        db.commit()
-        db.refresh(db_reading)
-        
-        # Create alert if anomaly detected
-        if prediction['is_anomaly']:
-            alert = Alert(
-                user_id=reading.user_id,
-                alert_type="anomaly",
-                message=f"Anomaly detected: HR={reading.heart_rate}, SpO2={reading.blood_oxygen}%",
-                severity="high" if prediction['confidence'] > 80 else "medium"
-            )
-            db.add(alert)
-            db.commit()
+        # Score the reading and wait for its group commit
+        db_reading, prediction = await ingest_reading(reading)
         
         return db_reading
     
+    except InferenceTimeoutError as e:
+        logger.warning(f"Inference pool saturated: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Anomaly detection is busy, please retry"
+        )
     except Exception as e:
         logger.error(f"Error creating health reading: {e}")
         raise HTTPException(
@@ -62,31 +59,252 @@ async def create_health_reading(
             detail="Failed to create health reading"
         )
 
+@router.post("/readings/batch", response_model=HealthDataBatchResponse)
+async def create_health_readings_batch(
+    batch: HealthDataBatchCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """Create many health readings at once, scored in one model call and written in one transaction"""
+    try:
+        result = await ingest_readings(batch.readings)
+        return HealthDataBatchResponse(received=len(batch.readings), **result)
+    
+    except InferenceTimeoutError as e:
+        logger.warning(f"Inference pool saturated: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Anomaly detection is busy, please retry"
+        )
+    except Exception as e:
+        logger.error(f"Error creating health readings batch: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create health readings batch"
+        )
+
+class _BodyStreamingResponse(StreamingResponse):
+    # The default StreamingResponse also reads the receive channel to watch
+    # for disconnects, which would steal body chunks from a handler that is
+    # still consuming the request while streaming its response
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+async def _ndjson_ingest_acks(request: Request) -> AsyncIterator[bytes]:
+    chunk_size = settings.INGEST_STREAM_CHUNK_SIZE
+    max_line_bytes = settings.INGEST_STREAM_MAX_LINE_BYTES
+    buffer = b""
+    line_number = 0
+    first_line = 1
+    chunk: List[HealthDataCreate] = []
+    errors: List[dict] = []
+    totals = {'received': 0, 'inserted': 0, 'rejected': 0, 'chunks': 0}
+    
+    async def flush() -> bytes:
+        nonlocal chunk, errors, first_line
+        ack = {
+            'chunk': totals['chunks'],
+            'first_line': first_line,
+            'last_line': line_number,
+            'inserted': 0,
+            'anomaly_count': 0,
+            'alerts_created': 0
+        }
+        if chunk:
+            ack.update(await ingest_readings(chunk))
+        ack['errors'] = errors
+        totals['inserted'] += ack['inserted']
+        totals['chunks'] += 1
+        chunk, errors, first_line = [], [], line_number + 1
+        return json.dumps(ack).encode() + b"\n"
+    
+    def parse(line: bytes):
+        line = line.strip()
+        if not line:
+            return
+        totals['received'] += 1
+        try:
+            chunk.append(HealthDataCreate.parse_raw(line))
+        except ValidationError as e:
+            totals['rejected'] += 1
+            errors.append({'line': line_number, 'error': str(e)})
+    
+    try:
+        async for data in request.stream():
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                line_number += 1
+                parse(line)
+                if len(chunk) >= chunk_size:
+                    yield await flush()
+            if len(buffer) > max_line_bytes:
+                raise ValueError(f"Line {line_number + 1} exceeds {max_line_bytes} bytes")
+        
+        if buffer:
+            line_number += 1
+            parse(buffer)
+        if chunk or errors:
+            yield await flush()
+        
+        yield json.dumps({'done': True, **totals}).encode() + b"\n"
+    
+    except Exception as e:
+        # The status line is already sent, so report the failure in-band.
+        # Every chunk acknowledged before this line is committed.
+        logger.error(f"Error streaming health readings: {e}")
+        yield json.dumps({
+            'done': False,
+            'error': str(e),
+            'resume_from_line': first_line,
+            **totals
+        }).encode() + b"\n"
+
+@router.post("/readings/stream")
+async def stream_health_readings(
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Ingest an NDJSON body of readings in bounded chunks, streaming back one ack per chunk"""
+    return _BodyStreamingResponse(
+        _ndjson_ingest_acks(request),
+        media_type="application/x-ndjson"
+    )
+
 @router.get("/readings", response_model=List[HealthDataResponse])
 async def get_health_readings(
+    response: Response,
     user_id: Optional[str] = None,
     limit: int = 100,
     skip: int = 0,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get health readings for a user"""
-    query = db.query(HealthData)
+    """Get health readings for a user, newest first, including archived ones; follow X-Next-Cursor for the next page"""
+    query = select(HealthData)
     
     if user_id:
-        query = query.filter(HealthData.user_id == user_id)
+        query = query.where(HealthData.user_id == user_id)
+    
+    # The first page of a user's readings usually comes straight from memory
+    readings = None
+    if user_id and not cursor and not skip:
+        readings = await hot_cache.recent(user_id, limit)
+    if readings is None:
+        result = await db.execute(keyset_page(query, HealthData.timestamp, HealthData.id, cursor, skip, limit))
+        readings = list(result.scalars().all())
     
-    readings = query.order_by(HealthData.timestamp.desc()).offset(skip).limit(limit).all()
+    # Past the end of the hot table, continue into the user's archived months
+    if user_id and len(readings) < limit:
+        if readings:
+            before, archive_skip = (readings[-1].timestamp, readings[-1].id), 0
+        elif cursor:
+            before, archive_skip = decode_cursor(cursor), 0
+        elif skip:
+            hot_total = (await db.execute(
+                select(func.count(HealthData.id)).where(HealthData.user_id == user_id)
+            )).scalar()
+            before, archive_skip = None, max(skip - hot_total, 0)
+        else:
+            before, archive_skip = None, 0
+        readings += await asyncio.to_thread(
+            reading_archive.page, user_id, before, archive_skip, limit - len(readings)
+        )
+    
+    set_next_cursor(response, readings, limit, 'timestamp')
     return readings
 
+@router.get("/series/{user_id}", response_model=DownsampledSeries)
+async def get_downsampled_series(
+    user_id: str,
+    metric: str = Query('heart_rate', regex=r'^(heart_rate|blood_oxygen)$'),
+    method: str = Query('minmax', regex=r'^(minmax|lttb)$'),
+    points: int = Query(500, ge=3, le=MAX_SERIES_POINTS),
+    days: int = 30,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get a chart series of at most `points` entries for a time range (min/max buckets or LTTB)"""
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=days)
+    if start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start must be before end"
+        )
+    
+    try:
+        return await downsample_series(db, user_id, metric, start, end, points, method)
+    
+    except Exception as e:
+        logger.error(f"Error downsampling health readings: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to downsample health readings"
+        )
+
+def _percentile_label(q: float) -> str:
+    return f"p{q * 100:g}"
+
+@router.get("/population/quantiles", response_model=PopulationQuantiles)
+async def get_population_quantiles(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    hours: int = Query(24, ge=1),
+    q: List[float] = Query([0.5, 0.95, 0.99]),
+    current_user: User = Depends(get_current_user)
+):
+    """Get fleet-wide percentiles of each vital over the hours overlapping a time range"""
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(hours=hours)
+    if start >= end or not all(0 <= quantile <= 1 for quantile in q):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start must be before end and quantiles must be within [0, 1]"
+        )
+    
+    try:
+        results = await asyncio.gather(*(
+            asyncio.to_thread(sketch_store.quantiles, metric, start, end, q)
+            for metric in SKETCH_METRICS
+        ))
+        return PopulationQuantiles(
+            start=start,
+            end=end,
+            metrics={
+                metric: MetricQuantiles(
+                    count=count,
+                    quantiles={_percentile_label(quantile): value for quantile, value in zip(q, values)}
+                )
+                for metric, (count, values) in zip(SKETCH_METRICS, results)
+            }
+        )
+    
+    except BackfillPendingError as e:
+        logger.warning(f"Population quantiles unavailable: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Population quantiles are unavailable until the sketch backfill has run"
+        )
+    except Exception as e:
+        logger.error(f"Error computing population quantiles: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to compute population quantiles"
+        )
+
 @router.get("/readings/{reading_id}", response_model=HealthDataResponse)
 async def get_health_reading(
     reading_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get a specific health reading"""
-    reading = db.query(HealthData).filter(HealthData.id == reading_id).first()
+    reading = await db.get(HealthData, reading_id)
     if not reading:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -101,9 +319,15 @@ async def predict_anomaly(
 ):
     """Get anomaly prediction for given health metrics"""
     try:
-        prediction = ml_service.predict(request.heart_rate, request.blood_oxygen)
+        prediction = await prediction_batcher.predict(request.heart_rate, request.blood_oxygen)
         return PredictionResponse(**prediction)
     
+    except InferenceTimeoutError as e:
+        logger.warning(f"Inference pool saturated: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Anomaly detection is busy, please retry"
+        )
     except Exception as e:
         logger.error(f"Prediction error: {e}")
         raise HTTPException(
@@ -111,44 +335,31 @@ async def predict_anomaly(
             detail="Failed to make prediction"
         )
 
+async def compute_health_metrics(
+    db: AsyncSession,
+    user_id: str,
+    start: datetime,
+    end: Optional[datetime] = None,
+    extended: bool = False
+) -> HealthMetrics:
+    """Aggregate a user's readings in [start, end), using the rollups for whole hours and days"""
+    aggregate = await range_aggregate(db, user_id, start, end)
+    return aggregate.to_metrics(extended)
+
 @router.get("/metrics/{user_id}", response_model=HealthMetrics)
 async def get_health_metrics(
     user_id: str,
     days: int = 7,
-    db: Session = Depends(get_db),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    extended: bool = False,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get health metrics summary for a user"""
+    """Get health metrics summary for a user over the last N days or an explicit [start, end) window"""
     try:
-        # Get readings from last N days
-        since_date = datetime.utcnow() - timedelta(days=days)
-        readings = db.query(HealthData).filter(
-            HealthData.user_id == user_id,
-            HealthData.timestamp >= since_date
-        ).all()
-        
-        if not readings:
-            return HealthMetrics(
-                avg_heart_rate=0,
-                avg_blood_oxygen=0,
-                anomaly_count=0,
-                total_readings=0,
-                last_reading_time=None
-            )
-        
-        # Calculate metrics
-        avg_hr = sum(r.heart_rate for r in readings) / len(readings)
-        avg_spo2 = sum(r.blood_oxygen for r in readings) / len(readings)
-        anomaly_count = sum(1 for r in readings if r.is_anomaly)
-        last_reading = max(readings, key=lambda x: x.timestamp)
-        
-        return HealthMetrics(
-            avg_heart_rate=round(avg_hr, 1),
-            avg_blood_oxygen=round(avg_spo2, 1),
-            anomaly_count=anomaly_count,
-            total_readings=len(readings),
-            last_reading_time=last_reading.timestamp
-        )
+        since_date = start or datetime.utcnow() - timedelta(days=days)
+        return await compute_health_metrics(db, user_id, since_date, end, extended)
     
     except Exception as e:
         logger.error(f"Error getting health metrics: {e}")
@@ -157,63 +368,119 @@ async def get_health_metrics(
             detail="Failed to get health metrics"
         )
 
-@router.get("/dashboard/{user_id}", response_model=DashboardData)
+async def compute_anomaly_trend(
+    db: AsyncSession,
+    user_id: str,
+    trend_length: int,
+    bucket: str
+) -> List[dict]:
+    """Per-bucket reading and anomaly counts ending with the current bucket, from the rollups"""
+    end = bucket_start(datetime.utcnow(), bucket) + BUCKET_SIZES[bucket]
+    first_bucket = end - BUCKET_SIZES[bucket] * trend_length
+    rollups = await rollup_buckets(db, bucket, user_id, first_bucket, end)
+    buckets = {rollup.bucket_start: (rollup.reading_count, rollup.anomaly_count) for rollup in rollups}
+    
+    anomaly_trend = []
+    for i in range(trend_length):
+        start = first_bucket + BUCKET_SIZES[bucket] * i
+        count, anomaly_count = buckets.get(start, (0, 0))
+        anomaly_trend.append({
+            'date': start.isoformat(),
+            'anomaly_count': anomaly_count,
+            'total_readings': count
+        })
+    
+    return anomaly_trend
+
+async def _recent_readings(user_id: str, since: datetime, limit: int) -> List[HealthData]:
+    readings = await hot_cache.recent(user_id, limit, since)
+    if readings is not None:
+        return readings
+    
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(HealthData).where(
+            HealthData.user_id == user_id,
+            HealthData.timestamp >= since
+        ).order_by(HealthData.timestamp.desc()).limit(limit))
+        return result.scalars().all()
+
+async def _recent_alerts(user_id: str, limit: int) -> List[Alert]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(Alert).where(
+            Alert.user_id == user_id
+        ).order_by(Alert.created_at.desc()).limit(limit))
+        return result.scalars().all()
+
+async def _anomaly_trend(user_id: str, trend_length: int, bucket: str) -> List[dict]:
+    async with AsyncSessionLocal() as db:
+        return await compute_anomaly_trend(db, user_id, trend_length, bucket)
+
+async def _weekly_metrics(user_id: str, now: datetime) -> HealthMetrics:
+    async with AsyncSessionLocal() as db:
+        return await compute_health_metrics(db, user_id, now - timedelta(days=7), now)
+
+def _json_response(entry: CachedResponse, if_none_match: Optional[str]) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, entry.etag):
+        dashboard_cache_not_modified.inc()
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+@router.get(
+    "/dashboard/{user_id}",
+    response_model=DashboardData,
+    responses={304: {"description": "Dashboard unchanged since the ETag in If-None-Match"}}
+)
 async def get_dashboard_data(
+    request: Request,
     user_id: str,
-    db: Session = Depends(get_db),
+    trend_length: int = Query(7, ge=1, le=744),
+    bucket: str = Query('day', regex=r'^(hour|day)$'),
     current_user: User = Depends(get_current_user)
 ):
-    """Get comprehensive dashboard data for a user"""
+    """Get comprehensive dashboard data for a user (ETag / If-None-Match aware)"""
+    cache_key = (user_id, trend_length, bucket)
+    if_none_match = request.headers.get("if-none-match")
+    
+    # Most polls find nothing new: answer them from the cache, usually with a 304
+    cached = dashboard_cache.get(cache_key)
+    if cached is not None:
+        dashboard_cache_hits.inc()
+        return _json_response(cached, if_none_match)
+    dashboard_cache_misses.inc()
+    
     try:
-        # Get recent readings (last 24 hours)
-        since_24h = datetime.utcnow() - timedelta(hours=24)
-        recent_readings = db.query(HealthData).filter(
-            HealthData.user_id == user_id,
-            HealthData.timestamp >= since_24h
-        ).order_by(HealthData.timestamp.desc()).limit(50).all()
-        
-        # Get metrics (last 7 days)
-        metrics = await get_health_metrics(user_id, 7, db, current_user)
-        
-        # Get recent alerts
-        alerts = db.query(Alert).filter(
-            Alert.user_id == user_id
-        ).order_by(Alert.created_at.desc()).limit(10).all()
-        
-        # Get anomaly trend (last 7 days)
-        since_7d = datetime.utcnow() - timedelta(days=7)
-        anomaly_readings = db.query(HealthData).filter(
-            HealthData.user_id == user_id,
-            HealthData.timestamp >= since_7d
-        ).all()
-        
-        # Group by day for trend
-        anomaly_trend = []
-        for i in range(7):
-            day = datetime.utcnow() - timedelta(days=i)
-            day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = day_start + timedelta(days=1)
-            
-            day_readings = [r for r in anomaly_readings 
-                          if day_start <= r.timestamp < day_end]
-            anomaly_count = sum(1 for r in day_readings if r.is_anomaly)
+        with dashboard_cache.building(user_id) as version:
+            # Recent readings (last 24 hours), metrics (last 7 days), recent
+            # alerts and the anomaly trend are independent, so run them
+            # concurrently on their own sessions
+            now = datetime.utcnow()
+            since_24h = now - timedelta(hours=24)
+            recent_readings, metrics, alerts, anomaly_trend = await asyncio.gather(
+                _recent_readings(user_id, since_24h, 50),
+                _weekly_metrics(user_id, now),
+                _recent_alerts(user_id, 10),
+                _anomaly_trend(user_id, trend_length, bucket)
+            )
             
-            anomaly_trend.append({
-                'date': day_start.isoformat(),
-                'anomaly_count': anomaly_count,
-                'total_readings': len(day_readings)
-            })
-        
-        return DashboardData(
-            recent_readings=recent_readings,
-            metrics=metrics,
-            alerts=alerts,
-            anomaly_trend=list(reversed(anomaly_trend))
-        )
+            dashboard = DashboardData(
+                recent_readings=recent_readings,
+                metrics=metrics,
+                alerts=alerts,
+                anomaly_trend=anomaly_trend
+            )
+            entry = dashboard_cache.put(
+                cache_key,
+                version,
+                dashboard.json().encode(),
+                valid_until=bucket_start(now, bucket) + BUCKET_SIZES[bucket]
+            )
     
     except Exception as e:
         logger.error(f"Error getting dashboard data: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to get dashboard data"
-        )
\ No newline at end of file
+        )
+    
+    return _json_response(entry, if_none_match)
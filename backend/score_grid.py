@@ -0,0 +1,102 @@
+import numpy as np
+from typing import Callable, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Input bounds enforced by HealthDataCreate
+HEART_RATE_RANGE = (30.0, 220.0)
+BLOOD_OXYGEN_RANGE = (70.0, 100.0)
+
+ScoreFn = Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]]
+
+class AnomalyScoreGrid:
+    """Precomputed anomaly scores over the full [heart_rate, blood_oxygen] input space.
+    
+    The exact model is evaluated once on a dense grid. Scoring is then a
+    bilinear interpolation between the four surrounding grid points. Inputs
+    outside the grid (e.g. /predict requests, which are not range-checked)
+    are scored by the exact model the grid was built from, or clamped to its
+    edge when there is none. The forest's score surface is piecewise
+    constant, so the interpolation error concentrates along split
+    boundaries. build() measures it against the exact model.
+    """
+    
+    def __init__(
+        self,
+        scores: np.ndarray,
+        hr_range: Tuple[float, float],
+        spo2_range: Tuple[float, float],
+        exact_fn: Optional[ScoreFn] = None
+    ):
+        self.scores = scores
+        self.exact_fn = exact_fn
+        self.hr_min, self.hr_max = hr_range
+        self.spo2_min, self.spo2_max = spo2_range
+        self.hr_step = (self.hr_max - self.hr_min) / (scores.shape[0] - 1)
+        self.spo2_step = (self.spo2_max - self.spo2_min) / (scores.shape[1] - 1)
+        self.max_error = None
+        self.label_mismatch_rate = None
+    
+    @classmethod
+    def build(
+        cls,
+        score_fn: ScoreFn,
+        resolution: int = 256,
+        hr_range: Tuple[float, float] = HEART_RATE_RANGE,
+        spo2_range: Tuple[float, float] = BLOOD_OXYGEN_RANGE
+    ) -> "AnomalyScoreGrid":
+        """Evaluate score_fn over a resolution x resolution grid and measure the lookup error"""
+        hr_axis = np.linspace(hr_range[0], hr_range[1], resolution)
+        spo2_axis = np.linspace(spo2_range[0], spo2_range[1], resolution)
+        hr, spo2 = np.meshgrid(hr_axis, spo2_axis, indexing="ij")
+        scores, _ = score_fn(np.column_stack([hr.ravel(), spo2.ravel()]))
+        grid = cls(scores.reshape(resolution, resolution), hr_range, spo2_range, exact_fn=score_fn)
+        
+        # Cell centres are where bilinear interpolation is furthest from the grid points
+        hr_mid = (hr_axis[:-1] + hr_axis[1:]) / 2
+        spo2_mid = (spo2_axis[:-1] + spo2_axis[1:]) / 2
+        hr, spo2 = np.meshgrid(hr_mid, spo2_mid, indexing="ij")
+        X_check = np.column_stack([hr.ravel(), spo2.ravel()])
+        expected, expected_labels = score_fn(X_check)
+        actual, actual_labels = grid.score(X_check)
+        grid.max_error = float(np.max(np.abs(actual - expected)))
+        grid.label_mismatch_rate = float(np.mean(actual_labels != expected_labels))
+        
+        logger.info(
+            f"Anomaly score grid {resolution}x{resolution} built: max error {grid.max_error:.4f}, "
+            f"label mismatch rate {grid.label_mismatch_rate:.4%}"
+        )
+        return grid
+    
+    def score(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (decision_function, is_anomaly) by bilinear lookup"""
+        X = np.asarray(X, dtype=np.float64)
+        n_hr, n_spo2 = self.scores.shape
+        
+        u = np.clip((X[:, 0] - self.hr_min) / self.hr_step, 0, n_hr - 1)
+        v = np.clip((X[:, 1] - self.spo2_min) / self.spo2_step, 0, n_spo2 - 1)
+        i = np.minimum(u.astype(np.intp), n_hr - 2)
+        j = np.minimum(v.astype(np.intp), n_spo2 - 2)
+        fu = u - i
+        fv = v - j
+        
+        g = self.scores
+        anomaly_scores = (
+            (g[i, j] * (1 - fu) + g[i + 1, j] * fu) * (1 - fv)
+            + (g[i, j + 1] * (1 - fu) + g[i + 1, j + 1] * fu) * fv
+        )
+        
+        if self.exact_fn is not None:
+            outside = ~self.contains(X)
+            if outside.any():
+                anomaly_scores[outside], _ = self.exact_fn(X[outside])
+        return anomaly_scores, anomaly_scores < 0
+    
+    def contains(self, X: np.ndarray) -> np.ndarray:
+        """Mask of the rows that lie on the grid (NaN rows do not)"""
+        X = np.asarray(X, dtype=np.float64)
+        return (
+            (X[:, 0] >= self.hr_min) & (X[:, 0] <= self.hr_max)
+            & (X[:, 1] >= self.spo2_min) & (X[:, 1] <= self.spo2_max)
+        )
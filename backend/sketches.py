@@ -0,0 +1,300 @@
+from sqlalchemy import select, delete
+from sqlalchemy.engine import Connection, Engine
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from datetime import datetime
+import argparse
+import asyncio
+import logging
+import random
+import threading
+import time
+import numpy as np
+from .archive import reading_archive
+from .backfills import SKETCH_BACKFILL, BackfillPendingError, backfill_applied_sync
+from .config import settings
+from .database import HealthData, VitalsSketch, engine
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+SKETCH_METRICS = ('heart_rate', 'blood_oxygen', 'anomaly_score')
+
+sketch_flush_histogram = Histogram(
+    "lifecare_sketch_flush_seconds",
+    "Time spent merging pending quantile sketches into the database",
+    buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0]
+)
+
+class KLLSketch:
+    """KLL streaming quantile sketch (Karnin, Lang & Liberty).
+    
+    Level h holds items of weight 2**h; when a level outgrows its capacity
+    it is sorted and every other item (from a random offset) is promoted.
+    Memory stays O(k) and the rank error is about 1.7/k with k=200, and
+    sketches of different hours merge by concatenating their levels.
+    """
+    
+    def __init__(self, k: int = 200):
+        self.k = k
+        self.n = 0
+        self.levels: List[np.ndarray] = [np.empty(0)]
+    
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+    
+    def update(self, values: Sequence[float]):
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += len(values)
+        self._compress()
+    
+    def merge(self, other: "KLLSketch"):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+    
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item stays behind so the total weight is preserved; picking it
+                # at random, rather than always the largest, keeps the ranks unbiased
+                if len(items) % 2:
+                    leftover = random.randrange(len(items))
+                    keep, pairs = items[leftover:leftover + 1], np.delete(items, leftover)
+                else:
+                    keep, pairs = items[:0], items
+                promoted = pairs[random.getrandbits(1)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+    
+    def weighted_items(self) -> Tuple[np.ndarray, np.ndarray]:
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        return values, weights
+    
+    def to_bytes(self) -> bytes:
+        header = np.array([self.k, self.n, len(self.levels), *(len(items) for items in self.levels)], dtype=np.int64)
+        return header.tobytes() + np.concatenate(self.levels).tobytes()
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "KLLSketch":
+        k, n, depth = np.frombuffer(data, dtype=np.int64, count=3)
+        sizes = np.frombuffer(data, dtype=np.int64, count=int(depth), offset=24)
+        values = np.frombuffer(data, dtype=np.float64, offset=24 + 8 * int(depth))
+        sketch = cls(int(k))
+        sketch.n = int(n)
+        sketch.levels = [values[start:end].copy() for start, end in zip(np.r_[0, np.cumsum(sizes)[:-1]], np.cumsum(sizes))]
+        return sketch
+
+def weighted_quantiles(sketches: Iterable[KLLSketch], quantiles: Sequence[float]) -> Tuple[int, List[Optional[float]]]:
+    """Quantiles of the union of several sketches, without building a merged sketch"""
+    values, weights, count = [], [], 0
+    for sketch in sketches:
+        sketch_values, sketch_weights = sketch.weighted_items()
+        values.append(sketch_values)
+        weights.append(sketch_weights)
+        count += sketch.n
+    if not count:
+        return 0, [None] * len(quantiles)
+    
+    values = np.concatenate(values)
+    weights = np.concatenate(weights)
+    order = np.argsort(values, kind='stable')
+    cumulative = np.cumsum(weights[order])
+    ranks = np.searchsorted(cumulative, np.asarray(quantiles) * cumulative[-1], side='left')
+    return count, values[order][np.minimum(ranks, len(values) - 1)].tolist()
+
+def _hour(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def _group_by_hour(rows: Iterable[Dict[str, Any]]) -> Dict[Tuple[datetime, str], List[float]]:
+    groups: Dict[Tuple[datetime, str], List[float]] = {}
+    for row in rows:
+        hour = _hour(row['timestamp'])
+        for metric in SKETCH_METRICS:
+            value = row[metric]
+            if value is not None and value == value:
+                groups.setdefault((hour, metric), []).append(value)
+    return groups
+
+def merge_into_table(conn: Connection, sketches: Dict[Tuple[datetime, str], KLLSketch]):
+    """Merge sketches into their stored hourly rows (read, merge, write).
+    
+    Not safe to run concurrently in one process: SketchStore serialises its
+    flushes with its flush lock, since SQLite has no SELECT ... FOR UPDATE.
+    """
+    if not sketches:
+        return
+    hours = sorted({hour for hour, _ in sketches})
+    stored = {
+        (row.bucket_start, row.metric): row
+        for row in conn.execute(select(VitalsSketch.__table__).where(
+            VitalsSketch.bucket_start.in_(hours)
+        ))
+    }
+    for (hour, metric), sketch in sketches.items():
+        row = stored.get((hour, metric))
+        if row is None:
+            conn.execute(VitalsSketch.__table__.insert().values(
+                bucket_start=hour, metric=metric, count=sketch.n, sketch=sketch.to_bytes()
+            ))
+            continue
+        merged = KLLSketch.from_bytes(row.sketch)
+        merged.merge(sketch)
+        conn.execute(VitalsSketch.__table__.update().where(
+            VitalsSketch.bucket_start == hour,
+            VitalsSketch.metric == metric
+        ).values(count=merged.n, sketch=merged.to_bytes()))
+
+class SketchStore:
+    """Hourly population sketches of each vital, fed by ingest.
+    
+    Committed readings are folded into in-memory sketches under a short
+    lock; a background task merges them into vitals_sketches every
+    flush_interval seconds. Queries read the stored hours plus whatever is
+    still pending, under the same lock the flush holds, so a reading is
+    never counted twice.
+    
+    Pending sketches live only in memory: a crash loses up to
+    flush_interval seconds of readings from the sketches, though not from
+    health_data. `python -m backend.sketches rebuild` recounts them.
+    """
+    
+    def __init__(self, engine: Engine, k: int, flush_interval: float):
+        self.engine = engine
+        self.k = k
+        self.flush_interval = flush_interval
+        self._pending: Dict[Tuple[datetime, str], KLLSketch] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+    
+    def add(self, reading_rows: Iterable[Dict[str, Any]]):
+        """Fold committed readings into the pending sketches"""
+        groups = _group_by_hour(reading_rows)
+        with self._lock:
+            for key, values in groups.items():
+                sketch = self._pending.get(key)
+                if sketch is None:
+                    sketch = self._pending[key] = KLLSketch(self.k)
+                sketch.update(values)
+    
+    def flush(self):
+        started = time.perf_counter()
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                with self.engine.begin() as conn:
+                    merge_into_table(conn, pending)
+            except Exception:
+                # Put the sketches back so the next flush retries them
+                with self._lock:
+                    for key, sketch in pending.items():
+                        if key in self._pending:
+                            sketch.merge(self._pending[key])
+                        self._pending[key] = sketch
+                raise
+        sketch_flush_histogram.observe(time.perf_counter() - started)
+    
+    def quantiles(
+        self,
+        metric: str,
+        start: datetime,
+        end: datetime,
+        quantiles: Sequence[float]
+    ) -> Tuple[int, List[Optional[float]]]:
+        """(count, values) for the hours overlapping [start, end).
+        
+        Raises BackfillPendingError while the sketches only cover readings
+        ingested since the upgrade.
+        """
+        first_hour = _hour(start)
+        with self._flush_lock:
+            with self.engine.connect() as conn:
+                if not backfill_applied_sync(conn, SKETCH_BACKFILL):
+                    raise BackfillPendingError("Sketch backfill (migration 4) has not been applied")
+                stored = conn.execute(select(VitalsSketch.sketch).where(
+                    VitalsSketch.metric == metric,
+                    VitalsSketch.bucket_start >= first_hour,
+                    VitalsSketch.bucket_start < end
+                )).scalars().all()
+            with self._lock:
+                pending = [
+                    KLLSketch.from_bytes(sketch.to_bytes())
+                    for (hour, pending_metric), sketch in self._pending.items()
+                    if pending_metric == metric and first_hour <= hour < end
+                ]
+        sketches = [KLLSketch.from_bytes(data) for data in stored] + pending
+        return weighted_quantiles(sketches, quantiles)
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.warning(f"Sketch flush failed: {e}")
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+def rebuild_sketches(engine: Engine, k: int = 200, chunk_rows: int = 50000):
+    """Recompute every hourly sketch from the hot and archived readings"""
+    columns = [HealthData.timestamp, *(getattr(HealthData, metric) for metric in SKETCH_METRICS)]
+    with engine.begin() as conn:
+        conn.execute(delete(VitalsSketch))
+        
+        def merge_rows(rows):
+            sketches = {}
+            for key, values in _group_by_hour(rows).items():
+                sketch = sketches[key] = KLLSketch(k)
+                sketch.update(values)
+            merge_into_table(conn, sketches)
+        
+        result = conn.execution_options(yield_per=chunk_rows).execute(select(*columns))
+        for partition in result.mappings().partitions():
+            merge_rows(partition)
+        for user_id in reading_archive.users():
+            for rows in reading_archive.rows(user_id):
+                merge_rows(rows)
+    logger.info("Rebuilt vitals sketches")
+
+sketch_store = SketchStore(
+    engine,
+    k=settings.SKETCH_K,
+    flush_interval=settings.SKETCH_FLUSH_INTERVAL_SECONDS
+)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the hourly population quantile sketches")
+    parser.add_argument("command", choices=["rebuild"])
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    rebuild_sketches(engine, settings.SKETCH_K)
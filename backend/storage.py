@@ -0,0 +1,130 @@
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from typing import Dict, Optional
+import asyncio
+import logging
+import time
+from .metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# PRAGMAs applied to every new SQLite connection for each storage profile
+SQLITE_PROFILES: Dict[str, Dict[str, object]] = {
+    # SQLite defaults: rollback journal, full sync, readers block on writers
+    "default": {},
+    # WAL lets dashboard readers run alongside the ingest writer; NORMAL sync
+    # only fsyncs at checkpoints, so the database stays consistent but may lose
+    # the last commits on power loss
+    "throughput": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -65536,  # 64 MiB
+        "mmap_size": 268435456,  # 256 MiB
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 10000
+    },
+    # WAL concurrency, but every commit is fsynced (the default)
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+        "cache_size": -65536,
+        "mmap_size": 268435456
+    }
+}
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+def apply_sqlite_profile(engine: Engine, profile: str):
+    """Apply a storage profile's PRAGMAs on every connection the engine opens"""
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLite profile '{profile}', expected one of {sorted(SQLITE_PROFILES)}")
+    pragmas = SQLITE_PROFILES[profile]
+    if not pragmas:
+        return
+    
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+checkpoint_counter = Counter(
+    "lifecare_sqlite_checkpoints_total",
+    "WAL checkpoints run by the storage maintenance task"
+)
+checkpoint_latency_histogram = Histogram(
+    "lifecare_sqlite_checkpoint_seconds",
+    "Time spent running one WAL checkpoint",
+    buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0]
+)
+
+class SQLiteMaintenance:
+    """Background WAL checkpointing and statistics refresh for SQLite.
+    
+    A PASSIVE checkpoint runs every checkpoint_interval seconds, so the
+    WAL is folded back into the main file without stalling readers or the
+    writer. When the WAL has grown past wal_truncate_pages, a TRUNCATE
+    checkpoint resets it. PRAGMA optimize runs every optimize_interval
+    seconds and refreshes planner statistics for tables whose indexes need it.
+    """
+    
+    def __init__(
+        self,
+        engine: Engine,
+        checkpoint_interval: float = 30.0,
+        optimize_interval: float = 3600.0,
+        wal_truncate_pages: int = 50000
+    ):
+        self.engine = engine
+        self.checkpoint_interval = checkpoint_interval
+        self.optimize_interval = optimize_interval
+        self.wal_truncate_pages = wal_truncate_pages
+        self._task: Optional[asyncio.Task] = None
+    
+    def checkpoint(self) -> tuple:
+        """Run a WAL checkpoint, returning (busy, wal_pages, checkpointed_pages)"""
+        started = time.perf_counter()
+        with self.engine.connect() as conn:
+            busy, wal_pages, checkpointed = conn.execute(text("PRAGMA wal_checkpoint(PASSIVE)")).one()
+            if wal_pages >= self.wal_truncate_pages:
+                busy, wal_pages, checkpointed = conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)")).one()
+        checkpoint_counter.inc()
+        checkpoint_latency_histogram.observe(time.perf_counter() - started)
+        return busy, wal_pages, checkpointed
+    
+    def optimize(self):
+        """Refresh query planner statistics (bounded ANALYZE of tables that need it)"""
+        with self.engine.connect() as conn:
+            conn.execute(text("PRAGMA analysis_limit=1000"))
+            conn.execute(text("PRAGMA optimize=0x10002"))
+    
+    async def _run(self):
+        last_optimize = time.monotonic()
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await asyncio.to_thread(self.checkpoint)
+                if time.monotonic() - last_optimize >= self.optimize_interval:
+                    await asyncio.to_thread(self.optimize)
+                    last_optimize = time.monotonic()
+            except Exception as e:
+                logger.warning(f"SQLite maintenance failed: {e}")
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,32 @@
+from typing import Coroutine, Set
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TaskSet:
+    """Fire-and-forget tasks that are kept alive until they finish.
+    
+    The event loop only holds weak references to tasks, so a task that
+    nothing else references can be garbage-collected mid-flight. Each
+    spawned task is held here until done, and an exception it raises is
+    logged rather than lost.
+    """
+    
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks: Set[asyncio.Task] = set()
+    
+    def spawn(self, coro: Coroutine) -> asyncio.Task:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+        return task
+    
+    def _done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background {self.name} task failed: {task.exception()}")
+    
+    def __len__(self) -> int:
+        return len(self._tasks)
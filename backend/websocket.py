@@ -1,58 +1,105 @@
-from fastapi import WebSocket, WebSocketDisconnect
-from typing import List, Dict
+from fastapi import WebSocket, WebSocketDisconnect, status
+from jose import JWTError
+from pydantic import ValidationError
+from typing import Optional
+import asyncio
 import json
 import logging
 from datetime import datetime
+from .auth import decode_token
+from .config import settings
+from .connections import ConnectionManager
+from .models import HealthDataCreate, MAX_BATCH_READINGS
+from .ingest import ingest_reading, ingest_readings
 
 logger = logging.getLogger(__name__)
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+manager = ConnectionManager(send_timeout=settings.WS_SEND_TIMEOUT_SECONDS)
+
+def _parse_reading(data: dict, user_id: str) -> HealthDataCreate:
+    # Readings sent over a socket always belong to the socket's user
+    if not isinstance(data, dict):
+        raise ValueError("Each reading must be an object")
+    return HealthDataCreate(**{**data, 'user_id': user_id})
+
+async def handle_reading_message(message: dict, user_id: str) -> dict:
+    """Score and persist readings received over the socket, returning the ack frame"""
+    try:
+        if message.get("type") == "reading":
+            reading = _parse_reading(message.get("data"), user_id)
+            db_reading, prediction = await ingest_reading(reading)
+            return {
+                "type": "reading_ack",
+                "id": message.get("id"),
+                "reading_id": db_reading.id,
+                "anomaly_score": prediction['anomaly_score'],
+                "is_anomaly": prediction['is_anomaly'],
+                "confidence": prediction['confidence'],
+                "timestamp": datetime.utcnow().isoformat()
+            }
+        
+        readings = message.get("data")
+        if not isinstance(readings, list) or not readings:
+            raise ValueError("data must be a non-empty list of readings")
+        if len(readings) > MAX_BATCH_READINGS:
+            raise ValueError(f"At most {MAX_BATCH_READINGS} readings per frame")
+        result = await ingest_readings([_parse_reading(r, user_id) for r in readings])
+        return {
+            "type": "readings_ack",
+            "id": message.get("id"),
+            "received": len(readings),
+            **result,
+            "timestamp": datetime.utcnow().isoformat()
+        }
     
-    async def connect(self, websocket: WebSocket, user_id: str):
-        await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
-        logger.info(f"WebSocket connected for user: {user_id}")
+    except (ValidationError, ValueError, TypeError) as e:
+        return {"type": "error", "id": message.get("id"), "error": str(e)}
+    except Exception as e:
+        logger.error(f"WebSocket ingest error for user {user_id}: {e}")
+        return {"type": "error", "id": message.get("id"), "error": "Failed to store reading"}
+
+def _token_user(token: Optional[str]) -> Optional[str]:
+    if not token:
+        return None
+    try:
+        return decode_token(token).get("sub")
+    except JWTError:
+        return None
+
+async def authenticate_websocket(websocket: WebSocket, user_id: str) -> bool:
+    """Check the socket's token, from ?token= or a first {"type": "auth"} frame.
     
-    def disconnect(self, websocket: WebSocket, user_id: str):
-        if user_id in self.active_connections:
-            self.active_connections[user_id].remove(websocket)
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
-        logger.info(f"WebSocket disconnected for user: {user_id}")
+    The token's subject must be the user the socket is for.
+    """
+    token = websocket.query_params.get("token")
+    if token is None:
+        try:
+            frame = json.loads(await asyncio.wait_for(
+                websocket.receive_text(), timeout=settings.WS_AUTH_TIMEOUT_SECONDS
+            ))
+        except (asyncio.TimeoutError, ValueError):
+            return False
+        if isinstance(frame, dict) and frame.get("type") == "auth":
+            token = frame.get("token")
     
-    async def send_personal_message(self, message: dict, user_id: str):
-        if user_id in self.active_connections:
-            disconnected = []
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_text(json.dumps(message))
-                except:
-                    disconnected.append(connection)
-            
-            # Remove disconnected connections
-            for conn in disconnected:
-                self.active_connections[user_id].remove(conn)
-    
-    async def broadcast_to_all(self, message: dict):
-        for user_id, connections in self.active_connections.items():
-            disconnected = []
-            for connection in connections:
-                try:
-                    await connection.send_text(json.dumps(message))
-                except:
-                    disconnected.append(connection)
-            
-            # Remove disconnected connections
-            for conn in disconnected:
-                connections.remove(conn)
-
-manager = ConnectionManager()
+    if _token_user(token) != user_id:
+        return False
+    await websocket.send_text(json.dumps({
+        "type": "authenticated",
+        "timestamp": datetime.utcnow().isoformat()
+    }))
+    return True
 
 async def handle_websocket(websocket: WebSocket, user_id: str):
+    await websocket.accept()
+    try:
+        if not await authenticate_websocket(websocket, user_id):
+            logger.warning(f"WebSocket authentication failed for user: {user_id}")
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+    except WebSocketDisconnect:
+        return
+    
     await manager.connect(websocket, user_id)
     try:
         while True:
@@ -66,6 +113,10 @@ async def handle_websocket(websocket: WebSocket, user_id: str):
                     "type": "pong",
                     "timestamp": datetime.utcnow().isoformat()
                 }))
+            elif message.get("type") in ("reading", "readings"):
+                await websocket.send_text(json.dumps(
+                    await handle_reading_message(message, user_id)
+                ))
             elif message.get("type") == "subscribe":
                 # Handle subscription to specific data streams
                 await websocket.send_text(json.dumps({
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Concurrent read/write throughput of the SQLite storage profiles
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine, text
+
+# Add the project root to Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from backend.storage import SQLITE_PROFILES, apply_sqlite_profile
+
+SCHEMA = """
+CREATE TABLE health_data (
+    id INTEGER PRIMARY KEY,
+    user_id VARCHAR,
+    timestamp DATETIME,
+    heart_rate FLOAT,
+    blood_oxygen FLOAT,
+    anomaly_score FLOAT,
+    is_anomaly BOOLEAN
+)
+"""
+
+def seed(engine, users, rows):
+    """Fill the table with some history so reads have work to do"""
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(text(SCHEMA))
+        conn.execute(text("CREATE INDEX ix_health_data_user_id ON health_data (user_id)"))
+        conn.execute(
+            text("INSERT INTO health_data (user_id, timestamp, heart_rate, blood_oxygen, anomaly_score, is_anomaly) "
+                 "VALUES (:user_id, :timestamp, :heart_rate, :blood_oxygen, 0.1, 0)"),
+            [
+                {
+                    'user_id': f"user{i % users}",
+                    'timestamp': now - timedelta(seconds=i),
+                    'heart_rate': random.uniform(50, 120),
+                    'blood_oxygen': random.uniform(90, 100)
+                }
+                for i in range(rows)
+            ]
+        )
+
+def writer(engine, users, batch, stop, counts):
+    while not stop.is_set():
+        with engine.begin() as conn:
+            conn.execute(
+                text("INSERT INTO health_data (user_id, timestamp, heart_rate, blood_oxygen, anomaly_score, is_anomaly) "
+                     "VALUES (:user_id, :timestamp, 72, 98, 0.1, 0)"),
+                [{'user_id': f"user{random.randrange(users)}", 'timestamp': datetime.utcnow()} for _ in range(batch)]
+            )
+        counts['writes'] += batch
+
+def reader(engine, users, stop, counts):
+    while not stop.is_set():
+        with engine.connect() as conn:
+            conn.execute(
+                text("SELECT * FROM health_data WHERE user_id = :user_id ORDER BY timestamp DESC LIMIT 50"),
+                {'user_id': f"user{random.randrange(users)}"}
+            ).fetchall()
+        counts['reads'] += 1
+
+def run_profile(profile, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", pool_size=args.readers + 2)
+        apply_sqlite_profile(engine, profile)
+        seed(engine, args.users, args.rows)
+        
+        stop = threading.Event()
+        counts = {'reads': 0, 'writes': 0}
+        threads = [threading.Thread(target=writer, args=(engine, args.users, args.batch, stop, counts))]
+        threads += [threading.Thread(target=reader, args=(engine, args.users, stop, counts)) for _ in range(args.readers)]
+        
+        for t in threads:
+            t.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        engine.dispose()
+        
+        return counts['reads'] / args.seconds, counts['writes'] / args.seconds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--profiles", nargs="+", default=list(SQLITE_PROFILES), choices=list(SQLITE_PROFILES))
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=1, help="readings per write transaction")
+    args = parser.parse_args()
+    
+    print(f"{'profile':<12} {'reads/s':>10} {'writes/s':>10}")
+    for profile in args.profiles:
+        reads, writes = run_profile(profile, args)
+        print(f"{profile:<12} {reads:>10.0f} {writes:>10.0f}")
+
+if __name__ == "__main__":
+    main()
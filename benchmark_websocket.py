@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Broadcast latency of the WebSocket ConnectionManager against many sockets
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+# Add the project root to Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from backend.connections import ConnectionManager
+
+class FakeWebSocket:
+    """Stands in for a client socket; send_text only suspends when the client is slow"""
+    
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.received = 0
+    
+    async def accept(self):
+        pass
+    
+    async def send_text(self, text: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received += 1
+    
+    async def close(self, code: int = 1000):
+        pass
+
+async def sequential_broadcast(manager: ConnectionManager, message: dict):
+    """The previous behaviour: one json.dumps and one awaited send per socket, in turn"""
+    for connections in manager.active_connections.values():
+        for connection in connections:
+            await connection.send_text(json.dumps(message))
+
+async def run(args, strategy: str) -> float:
+    manager = ConnectionManager(send_timeout=args.timeout)
+    sockets = []
+    for i in range(args.sockets):
+        slow = random.random() < args.slow_fraction
+        websocket = FakeWebSocket(args.slow_delay if slow else 0.0)
+        sockets.append(websocket)
+        await manager.connect(websocket, f"user{i % args.users}")
+    
+    message = {"type": "health_update", "data": {"heart_rate": 72.0, "blood_oxygen": 98.0, "notes": "x" * args.payload}}
+    started = time.perf_counter()
+    for _ in range(args.messages):
+        if strategy == "sequential":
+            await sequential_broadcast(manager, message)
+        else:
+            await manager.broadcast_to_all(message)
+    return (time.perf_counter() - started) / args.messages
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sockets", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--payload", type=int, default=512, help="extra bytes per message")
+    parser.add_argument("--slow-fraction", type=float, default=0.001, help="share of sockets that stall")
+    parser.add_argument("--slow-delay", type=float, default=0.05, help="seconds a slow socket stalls per send")
+    parser.add_argument("--timeout", type=float, default=1.0, help="per-send timeout of the concurrent fan-out")
+    args = parser.parse_args()
+    
+    print(f"{'strategy':<12} {'ms/broadcast':>14}")
+    for strategy in ("sequential", "concurrent"):
+        random.seed(0)
+        seconds = asyncio.run(run(args, strategy))
+        print(f"{strategy:<12} {seconds * 1000:>14.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Point the backend at a scratch database and archive before it is imported
+_scratch = tempfile.mkdtemp(prefix="lifecare-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_scratch}/lifecare.db")
+os.environ.setdefault("ARCHIVE_DIR", f"{_scratch}/archive")
+os.environ.setdefault("MODEL_PATH", f"{_scratch}/models/anomaly_model.pkl")
+# The cheapest cost bcrypt accepts keeps login tests fast
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -0,0 +1,37 @@
+from datetime import datetime
+from backend.archive import ReadingArchive
+
+MONTH = datetime(2024, 1, 1)
+
+def _rows(ids):
+    return [
+        {
+            'id': i, 'timestamp': datetime(2024, 1, 1 + i % 28), 'created_at': datetime(2024, 1, 1),
+            'heart_rate': 60.0 + i, 'blood_oxygen': 97.0, 'temperature': None,
+            'blood_pressure_systolic': None, 'blood_pressure_diastolic': None,
+            'activity_level': 'low', 'anomaly_score': 0.1, 'is_anomaly': False
+        }
+        for i in ids
+    ]
+
+def test_parts_are_merged_on_read_and_compacted(tmp_path):
+    archive = ReadingArchive(str(tmp_path))
+    archive.publish([archive.stage("u", MONTH, _rows(range(0, 10)))])
+    # A chunk re-archived after a crash overlaps the first part
+    archive.publish([archive.stage("u", MONTH, _rows(range(5, 20)))])
+    
+    assert len(archive.parts("u", MONTH)) == 2
+    assert sorted(archive.load("u", MONTH)['id'].tolist()) == list(range(20))
+    
+    archive.compact("u", MONTH)
+    assert archive.parts("u", MONTH) == [archive.path("u", MONTH)]
+    assert sorted(archive.load("u", MONTH)['id'].tolist()) == list(range(20))
+
+def test_discarded_parts_are_never_visible(tmp_path):
+    archive = ReadingArchive(str(tmp_path))
+    staged = [archive.stage("u", MONTH, _rows(range(3)))]
+    assert archive.load("u", MONTH) is None
+    
+    archive.publish(staged)
+    archive.discard(staged)
+    assert archive.load("u", MONTH) is None
@@ -0,0 +1,75 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from backend.backfills import ROLLUP_BACKFILL, SKETCH_BACKFILL, BackfillPendingError
+from backend.database import Base, HealthData
+from backend.downsample import downsample_series
+from backend.migrations import applied_versions, run_migrations
+from backend.rollups import range_aggregate, rollup_buckets
+from backend.sketches import SketchStore
+
+NOW = datetime.utcnow().replace(microsecond=0)
+READINGS = 500
+
+def _seed(path):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    # Readings written before the rollup tables existed, so no rollup rows cover them
+    with engine.begin() as conn:
+        conn.execute(HealthData.__table__.insert(), [
+            {
+                'user_id': "u", 'timestamp': NOW - timedelta(minutes=17 * i), 'heart_rate': 60.0 + i % 40,
+                'blood_oxygen': 97.0, 'anomaly_score': 0.1, 'is_anomaly': i % 10 == 0
+            }
+            for i in range(READINGS)
+        ])
+    return engine
+
+async def _read(path):
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    try:
+        async with AsyncSession(async_engine) as db:
+            start = NOW - timedelta(days=7)
+            aggregate = await range_aggregate(db, "u", start, NOW + timedelta(seconds=1))
+            buckets = await rollup_buckets(db, 'day', "u", start.replace(hour=0, minute=0, second=0), NOW + timedelta(days=1))
+            series = await downsample_series(db, "u", "heart_rate", start, NOW + timedelta(seconds=1), 20)
+            return (
+                aggregate.count,
+                aggregate.anomaly_count,
+                sum(bucket.reading_count for bucket in buckets),
+                sum(bucket.anomaly_count for bucket in buckets),
+                series.total_readings
+            )
+    finally:
+        await async_engine.dispose()
+
+def test_readers_fall_back_to_raw_readings_while_the_rollup_backfill_is_pending(tmp_path):
+    path = tmp_path / "backfill.db"
+    engine = _seed(path)
+    run_migrations(engine, backfills=False)
+    assert ROLLUP_BACKFILL not in applied_versions(engine)
+    
+    expected = (READINGS, READINGS // 10, READINGS, READINGS // 10, READINGS)
+    assert asyncio.run(_read(path)) == expected
+    
+    run_migrations(engine)
+    assert asyncio.run(_read(path)) == expected
+    engine.dispose()
+
+def test_quantiles_refuse_to_answer_while_the_sketch_backfill_is_pending(tmp_path):
+    engine = _seed(tmp_path / "sketches.db")
+    run_migrations(engine, backfills=False)
+    assert SKETCH_BACKFILL not in applied_versions(engine)
+    
+    store = SketchStore(engine, k=200, flush_interval=60)
+    window = (NOW - timedelta(days=7), NOW + timedelta(hours=1))
+    with pytest.raises(BackfillPendingError):
+        store.quantiles('heart_rate', *window, [0.5])
+    
+    run_migrations(engine)
+    count, (median,) = store.quantiles('heart_rate', *window, [0.5])
+    assert count == READINGS
+    assert 75 <= median <= 85
+    engine.dispose()
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+from backend.compiled_forest import CompiledIsolationForest
+
+def _fit(n_features: int, max_features: float):
+    rng = np.random.default_rng(0)
+    X = rng.normal([75.0, 97.0, 36.8, 120.0][:n_features], [12.0, 2.0, 0.4, 15.0][:n_features], size=(2000, n_features))
+    scaler = StandardScaler().fit(X)
+    model = IsolationForest(
+        n_estimators=60, max_samples=256, contamination=0.05,
+        max_features=max_features, random_state=0
+    ).fit(scaler.transform(X))
+    # Fresh rows, with outliers well past the training range
+    X_test = np.vstack([rng.normal(X.mean(axis=0), X.std(axis=0) * 3, size=(1500, n_features)), X[:500]])
+    return model, scaler, X_test
+
+@pytest.mark.parametrize("n_features, max_features", [(2, 1.0), (4, 1.0), (4, 0.5)])
+def test_compiled_forest_matches_sklearn(n_features, max_features):
+    model, scaler, X = _fit(n_features, max_features)
+    compiled = CompiledIsolationForest.from_sklearn(model, scaler)
+    
+    decision, is_anomaly = compiled.score(X)
+    X_scaled = scaler.transform(X)
+    np.testing.assert_allclose(decision + compiled.offset, model.score_samples(X_scaled), rtol=0, atol=1e-12)
+    np.testing.assert_allclose(decision, model.decision_function(X_scaled), rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(is_anomaly, model.predict(X_scaled) == -1)
+    assert is_anomaly.any() and not is_anomaly.all()
+
+def test_compiled_forest_survives_save_and_load(tmp_path):
+    model, scaler, X = _fit(2, 1.0)
+    compiled = CompiledIsolationForest.from_sklearn(model, scaler)
+    path = str(tmp_path / "forest.npz")
+    compiled.save(path)
+    
+    loaded = CompiledIsolationForest.load(path)
+    np.testing.assert_array_equal(loaded.score(X)[0], compiled.score(X)[0])
@@ -0,0 +1,84 @@
+import uuid
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from backend.dashboard_cache import DashboardCache
+from backend.database import engine
+from backend.migrations import run_migrations
+from backend.routers import alerts, auth, health
+
+@pytest.fixture(scope="module")
+def client():
+    run_migrations(engine)
+    app = FastAPI()
+    app.include_router(auth.router, prefix="/api/v1")
+    app.include_router(health.router, prefix="/api/v1")
+    app.include_router(alerts.router, prefix="/api/v1")
+    with TestClient(app) as client:
+        username = f"user{uuid.uuid4().hex[:8]}"
+        client.post("/api/v1/auth/register", json={
+            "username": username, "email": f"{username}@example.com",
+            "password": "secret123", "full_name": "Test User"
+        })
+        login = client.post("/api/v1/auth/login", data={"username": username, "password": "secret123"}).json()
+        client.headers["Authorization"] = f"Bearer {login['access_token']}"
+        yield client
+
+def _poll(client, user_id: str, etag: str = None):
+    headers = {"If-None-Match": etag} if etag else {}
+    return client.get(f"/api/v1/health/dashboard/{user_id}", headers=headers)
+
+def _revalidate(client, user_id: str, etag: str) -> str:
+    """Poll with the previous ETag, expect a fresh body, and return its ETag"""
+    response = _poll(client, user_id, etag)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    return response.headers["ETag"]
+
+def test_alert_changes_invalidate_the_dashboard_etag(client):
+    user_id = f"patient-{uuid.uuid4().hex[:8]}"
+    response = _poll(client, user_id)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert _poll(client, user_id, etag).status_code == 304
+    
+    response = client.post("/api/v1/alerts/", json={
+        "user_id": user_id, "alert_type": "warning", "message": "Low SpO2", "severity": "high"
+    })
+    assert response.status_code == 200
+    alert_id = response.json()["id"]
+    etag = _revalidate(client, user_id, etag)
+    assert _poll(client, user_id).json()["alerts"][0]["is_read"] is False
+    
+    assert client.put(f"/api/v1/alerts/{alert_id}/read").status_code == 200
+    etag = _revalidate(client, user_id, etag)
+    assert _poll(client, user_id).json()["alerts"][0]["is_read"] is True
+    
+    assert client.delete(f"/api/v1/alerts/{alert_id}").status_code == 200
+    etag = _revalidate(client, user_id, etag)
+    assert _poll(client, user_id).json()["alerts"] == []
+    assert _poll(client, user_id, etag).status_code == 304
+
+def test_other_users_dashboards_stay_cached(client):
+    user_id, other = f"patient-{uuid.uuid4().hex[:8]}", f"patient-{uuid.uuid4().hex[:8]}"
+    etag = _poll(client, other).headers["ETag"]
+    
+    client.post("/api/v1/alerts/", json={
+        "user_id": user_id, "alert_type": "info", "message": "Check in", "severity": "low"
+    })
+    assert _poll(client, other, etag).status_code == 304
+
+def test_a_build_that_raced_an_invalidation_is_not_cached():
+    cache = DashboardCache(ttl=60, max_entries=10)
+    key = ("patient", 7, 'day')
+    
+    with cache.building("patient") as version:
+        cache.invalidate(["patient"])
+        cache.put(key, version, b"stale")
+    assert cache.get(key) is None
+    
+    with cache.building("patient") as version:
+        cache.put(key, version, b"fresh")
+    assert cache.get(key).body == b"fresh"
+    # No per-user build state outlives the builds
+    assert cache._builds == {} and cache._versions == {}
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+import asyncio
+import uuid
+import pytest
+from backend.database import Base, HealthData, engine
+from backend.hot_cache import HotWindowCache
+
+@pytest.fixture(scope="module", autouse=True)
+def tables():
+    Base.metadata.create_all(bind=engine)
+
+def _commit(user_id: str, heart_rate: float, timestamp: datetime) -> dict:
+    """Insert a reading the way ingest does and return the row it publishes"""
+    row = {
+        'user_id': user_id, 'timestamp': timestamp, 'heart_rate': heart_rate, 'blood_oxygen': 97.0,
+        'temperature': None, 'blood_pressure_systolic': None, 'blood_pressure_diastolic': None,
+        'activity_level': None, 'anomaly_score': 0.1, 'is_anomaly': False, 'created_at': timestamp
+    }
+    with engine.begin() as conn:
+        row_id = conn.execute(HealthData.__table__.insert().values(row)).inserted_primary_key[0]
+    return {**row, 'id': row_id}
+
+class RacingCache(HotWindowCache):
+    """Commits a reading after a load has read the table but before it installs its window"""
+    
+    def __init__(self, race):
+        super().__init__(capacity=50, max_bytes=1 << 20)
+        self.race = race
+    
+    def _install(self, user_id, ring, generation):
+        if self.race is not None:
+            race, self.race = self.race, None
+            race(self)
+        super()._install(user_id, ring, generation)
+
+def _heart_rates(readings):
+    return [reading.heart_rate for reading in readings]
+
+def test_ingest_during_a_load_is_not_lost():
+    user_id = f"patient-{uuid.uuid4().hex[:8]}"
+    now = datetime.utcnow().replace(microsecond=0)
+    for i in range(3):
+        _commit(user_id, 60.0 + i, now - timedelta(minutes=10 - i))
+    cache = RacingCache(lambda cache: cache.push([_commit(user_id, 99.0, now)]))
+    
+    async def read_twice():
+        # The first read began before the write, so it may miss it; the next must not
+        first = await cache.recent(user_id, 10)
+        return first, await cache.recent(user_id, 10)
+    first, second = asyncio.run(read_twice())
+    
+    assert _heart_rates(first) == [62.0, 61.0, 60.0]
+    assert _heart_rates(second) == [99.0, 62.0, 61.0, 60.0]
+    # The racing load was discarded and its write time forgotten once no load was in flight
+    assert cache._loads == {} and cache._generations == {}
+
+def test_ingest_after_a_load_updates_the_window():
+    user_id = f"patient-{uuid.uuid4().hex[:8]}"
+    now = datetime.utcnow().replace(microsecond=0)
+    _commit(user_id, 60.0, now - timedelta(minutes=5))
+    cache = RacingCache(None)
+    
+    async def read_push_read():
+        await cache.recent(user_id, 10)
+        cache.push([_commit(user_id, 70.0, now)])
+        return await cache.recent(user_id, 10)
+    
+    assert _heart_rates(asyncio.run(read_push_read())) == [70.0, 60.0]
+    assert user_id in cache._windows
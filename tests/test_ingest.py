@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+from datetime import datetime
+from sqlalchemy import func, select
+from backend.database import Base, HealthData, writer_engine
+from backend.ingest import WriteCoalescer
+
+class CountingCoalescer(WriteCoalescer):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.groups = []
+    
+    def _write_group(self, group):
+        self.groups.append(len(group))
+        return super()._write_group(group)
+
+@pytest.fixture(scope="module", autouse=True)
+def tables():
+    Base.metadata.create_all(bind=writer_engine)
+
+def _row(user_id, i, **extra):
+    return {
+        'user_id': user_id, 'timestamp': datetime.utcnow(), 'heart_rate': 60.0 + i,
+        'blood_oxygen': 97.0, 'anomaly_score': 0.1, 'is_anomaly': False, **extra
+    }
+
+def _count(user_id):
+    with writer_engine.connect() as conn:
+        return conn.execute(select(func.count()).where(HealthData.user_id == user_id)).scalar()
+
+async def _submit_all(coalescer, rows):
+    try:
+        return await asyncio.gather(*(coalescer.submit(row) for row in rows), return_exceptions=True)
+    finally:
+        coalescer.shutdown()
+
+def test_concurrent_submits_share_one_commit():
+    coalescer = CountingCoalescer(max_delay_ms=50, max_rows=500)
+    results = asyncio.run(_submit_all(coalescer, [_row("coalesced", i) for i in range(20)]))
+    
+    assert coalescer.groups == [20]
+    assert len(coalescer._commits) == 0
+    assert [reading.heart_rate for reading in results] == [60.0 + i for i in range(20)]
+    assert len({reading.id for reading in results}) == 20
+    assert _count("coalesced") == 20
+
+def test_max_rows_flushes_early():
+    coalescer = CountingCoalescer(max_delay_ms=10_000, max_rows=8)
+    asyncio.run(_submit_all(coalescer, [_row("capped", i) for i in range(16)]))
+    
+    assert coalescer.groups == [8, 8]
+    assert _count("capped") == 16
+
+def test_failed_group_fails_every_waiter():
+    coalescer = CountingCoalescer(max_delay_ms=50, max_rows=500)
+    rows = [_row("failed", i) for i in range(5)]
+    # One unknown column makes the whole group's transaction fail
+    rows.append(_row("failed", 5, no_such_column=1))
+    results = asyncio.run(_submit_all(coalescer, rows))
+    
+    assert coalescer.groups == [6]
+    assert all(isinstance(result, TypeError) for result in results)
+    assert _count("failed") == 0
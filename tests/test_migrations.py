@@ -0,0 +1,30 @@
+from datetime import datetime
+from sqlalchemy import create_engine
+from backend.database import Base, HealthData
+from backend.migrations import applied_versions, run_migrations, BACKFILL_VERSIONS, MIGRATIONS
+
+def _engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+
+def test_backfills_run_on_an_empty_database(tmp_path):
+    engine = _engine(tmp_path)
+    run_migrations(engine, backfills=False)
+    
+    assert applied_versions(engine) == {version for version, _, _ in MIGRATIONS}
+    engine.dispose()
+
+def test_backfills_are_deferred_when_readings_exist(tmp_path):
+    engine = _engine(tmp_path)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(HealthData.__table__.insert().values(
+            user_id="u", timestamp=datetime(2024, 1, 1), heart_rate=70.0,
+            blood_oxygen=98.0, anomaly_score=0.1, is_anomaly=False
+        ))
+    
+    run_migrations(engine, backfills=False)
+    assert not applied_versions(engine) & BACKFILL_VERSIONS
+    
+    run_migrations(engine)
+    assert applied_versions(engine) == {version for version, _, _ in MIGRATIONS}
+    engine.dispose()
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+import base64
+import uuid
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from backend.database import Alert, Base, HealthData, engine
+from backend.routers import alerts, auth, health
+
+ROWS = 23
+PAGE = 5
+
+@pytest.fixture(scope="module")
+def client():
+    Base.metadata.create_all(bind=engine)
+    app = FastAPI()
+    app.include_router(auth.router, prefix="/api/v1")
+    app.include_router(health.router, prefix="/api/v1")
+    app.include_router(alerts.router, prefix="/api/v1")
+    with TestClient(app) as client:
+        username = f"user{uuid.uuid4().hex[:8]}"
+        client.post("/api/v1/auth/register", json={
+            "username": username, "email": f"{username}@example.com",
+            "password": "secret123", "full_name": "Test User"
+        })
+        login = client.post("/api/v1/auth/login", data={"username": username, "password": "secret123"}).json()
+        client.headers["Authorization"] = f"Bearer {login['access_token']}"
+        yield client
+
+@pytest.fixture
+def user_id():
+    # Only three distinct instants, so most rows tie on the sort column and only the id orders them
+    user_id = f"patient-{uuid.uuid4().hex[:8]}"
+    instants = [datetime.utcnow().replace(microsecond=0) - timedelta(minutes=m) for m in (0, 1, 2)]
+    with engine.begin() as conn:
+        conn.execute(HealthData.__table__.insert(), [
+            {
+                'user_id': user_id, 'timestamp': instants[i % 3], 'heart_rate': 60.0 + i,
+                'blood_oxygen': 97.0, 'anomaly_score': 0.1, 'is_anomaly': False
+            }
+            for i in range(ROWS)
+        ])
+        conn.execute(Alert.__table__.insert(), [
+            {
+                'user_id': user_id, 'alert_type': "anomaly", 'message': f"alert {i}",
+                'severity': "medium", 'created_at': instants[i % 3]
+            }
+            for i in range(ROWS)
+        ])
+    return user_id
+
+def _offset_pages(client, url, user_id):
+    pages = []
+    for skip in range(0, ROWS + PAGE, PAGE):
+        response = client.get(url, params={'user_id': user_id, 'limit': PAGE, 'skip': skip})
+        assert response.status_code == 200
+        pages.append([row['id'] for row in response.json()])
+    return [page for page in pages if page]
+
+def _cursor_pages(client, url, user_id):
+    pages, params = [], {'user_id': user_id, 'limit': PAGE}
+    while True:
+        response = client.get(url, params=params)
+        assert response.status_code == 200
+        if response.json():
+            pages.append([row['id'] for row in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return pages
+        params = {'user_id': user_id, 'limit': PAGE, 'cursor': cursor}
+
+def _expected(table, column, user_id):
+    with engine.connect() as conn:
+        rows = conn.execute(
+            table.select().where(table.c.user_id == user_id).order_by(table.c[column].desc(), table.c.id.desc())
+        ).all()
+    return [row.id for row in rows]
+
+@pytest.mark.parametrize("url, table, column", [
+    ("/api/v1/health/readings", HealthData.__table__, 'timestamp'),
+    ("/api/v1/alerts/", Alert.__table__, 'created_at')
+])
+def test_cursor_pages_match_offset_pages_across_ties(client, user_id, url, table, column):
+    expected = _expected(table, column, user_id)
+    offset_pages = _offset_pages(client, url, user_id)
+    cursor_pages = _cursor_pages(client, url, user_id)
+    
+    assert cursor_pages == offset_pages
+    assert [row_id for page in cursor_pages for row_id in page] == expected
+    assert len(expected) == ROWS
+
+def _encode(raw: str) -> str:
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+@pytest.mark.parametrize("url", ["/api/v1/health/readings", "/api/v1/alerts/"])
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    _encode("no separator"),
+    _encode("2024-01-01T00:00:00|not-an-id"),
+    _encode("yesterday|12"),
+    base64.urlsafe_b64encode(b"\xff\xfe|1").decode()
+])
+def test_malformed_cursor_is_rejected(client, user_id, url, cursor):
+    response = client.get(url, params={'user_id': user_id, 'cursor': cursor})
+    assert response.status_code == 400
+    assert response.json()['detail'] == "Invalid cursor"
@@ -0,0 +1,12 @@
+from sqlalchemy import create_engine
+from backend.migrations import applied_versions, check_query_plans, run_migrations, MIGRATIONS
+from backend.storage import apply_sqlite_profile
+
+def test_hot_queries_use_their_indexes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'plans.db'}")
+    apply_sqlite_profile(engine, "throughput")
+    run_migrations(engine)
+    
+    assert applied_versions(engine) == {version for version, _, _ in MIGRATIONS}
+    assert check_query_plans(engine) == []
+    engine.dispose()
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+import uuid
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from backend.database import Base, RefreshToken, engine
+from backend.refresh_tokens import purge_refresh_tokens
+from backend.routers import auth
+
+@pytest.fixture(scope="module")
+def client():
+    Base.metadata.create_all(bind=engine)
+    app = FastAPI()
+    app.include_router(auth.router, prefix="/api/v1")
+    with TestClient(app) as client:
+        yield client
+
+def _login(client) -> dict:
+    username = f"user{uuid.uuid4().hex[:8]}"
+    response = client.post("/api/v1/auth/register", json={
+        "username": username, "email": f"{username}@example.com",
+        "password": "secret123", "full_name": "Test User"
+    })
+    assert response.status_code == 200
+    response = client.post("/api/v1/auth/login", data={"username": username, "password": "secret123"})
+    assert response.status_code == 200
+    return response.json()
+
+def _refresh(client, refresh_token: str):
+    return client.post("/api/v1/auth/refresh", json={"refresh_token": refresh_token})
+
+def test_refresh_rotates_both_tokens(client):
+    login = _login(client)
+    
+    response = _refresh(client, login["refresh_token"])
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["refresh_token"] != login["refresh_token"]
+    assert rotated["access_token"] != login["access_token"]
+    
+    assert _refresh(client, rotated["refresh_token"]).status_code == 200
+    assert _refresh(client, login["refresh_token"]).status_code == 401
+
+def test_reusing_a_spent_token_revokes_the_family(client):
+    login = _login(client)
+    rotated = _refresh(client, login["refresh_token"]).json()
+    
+    # The old token comes back (e.g. stolen): every descendant stops working
+    assert _refresh(client, login["refresh_token"]).status_code == 401
+    assert _refresh(client, rotated["refresh_token"]).status_code == 401
+    
+    # Other logins are unaffected
+    other = _login(client)
+    assert _refresh(client, other["refresh_token"]).status_code == 200
+
+def test_logout_revokes_the_refresh_token(client):
+    login = _login(client)
+    response = client.post(
+        "/api/v1/auth/logout",
+        json={"refresh_token": login["refresh_token"]},
+        headers={"Authorization": f"Bearer {login['access_token']}"}
+    )
+    assert response.status_code == 200
+    assert _refresh(client, login["refresh_token"]).status_code == 401
+    assert client.get("/api/v1/auth/me", headers={"Authorization": f"Bearer {login['access_token']}"}).status_code == 401
+
+def test_purge_removes_only_dead_tokens(client):
+    now = datetime.utcnow()
+    later, earlier = now + timedelta(days=1), now - timedelta(days=1)
+    family = lambda name: f"{name}-{uuid.uuid4().hex}"
+    live, dead, expired = family("live"), family("dead"), family("expired")
+    rows = {
+        "live-spent": (live, later, now),
+        "live-current": (live, later, None),
+        "dead-spent": (dead, later, now),
+        "dead-revoked": (dead, later, now),
+        "expired": (expired, earlier, None),
+        "live-expired": (live, earlier, now),
+    }
+    with engine.begin() as conn:
+        conn.execute(RefreshToken.__table__.insert(), [
+            {
+                "token_digest": f"{name}-{family_id}", "user_id": "u", "family_id": family_id,
+                "created_at": earlier, "expires_at": expires_at, "revoked_at": revoked_at
+            }
+            for name, (family_id, expires_at, revoked_at) in rows.items()
+        ])
+    
+    purge_refresh_tokens(engine)
+    
+    with engine.connect() as conn:
+        remaining = set(conn.execute(select(RefreshToken.token_digest).where(
+            RefreshToken.family_id.in_([live, dead, expired])
+        )).scalars())
+    # Spent tokens of a live family stay until they expire, so reuse is still detected
+    assert remaining == {f"live-spent-{live}", f"live-current-{live}"}
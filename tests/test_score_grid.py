@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from backend.config import settings
+from backend.score_grid import AnomalyScoreGrid
+
+def linear_score(X):
+    """A surface bilinear interpolation reproduces exactly, negative at low SpO2"""
+    X = np.asarray(X, dtype=np.float64)
+    scores = 0.002 * (X[:, 0] - 100.0) + 0.05 * (X[:, 1] - 92.0)
+    return scores, scores < 0
+
+class CountingScore:
+    def __init__(self):
+        self.rows = 0
+    
+    def __call__(self, X):
+        self.rows += len(X)
+        return linear_score(X)
+
+@pytest.fixture(scope="module")
+def grid():
+    return AnomalyScoreGrid.build(linear_score)
+
+def test_build_default_matches_the_configured_resolution(grid):
+    assert grid.scores.shape == (settings.ML_GRID_RESOLUTION, settings.ML_GRID_RESOLUTION)
+    assert grid.max_error < 1e-9
+    # Only rounding right on the zero contour can flip a label
+    assert grid.label_mismatch_rate < 1e-4
+
+def test_lookup_inside_the_grid(grid):
+    rng = np.random.default_rng(3)
+    X = np.column_stack([rng.uniform(30, 220, 1000), rng.uniform(70, 100, 1000)])
+    X = np.vstack([X, [[30.0, 70.0], [220.0, 100.0]]])
+    scores, labels = grid.score(X)
+    expected, expected_labels = linear_score(X)
+    
+    assert grid.contains(X).all()
+    assert np.allclose(scores, expected, atol=1e-9)
+    assert np.array_equal(labels, scores < 0)
+
+def test_out_of_grid_rows_use_the_exact_model(grid):
+    X = np.array([[75.0, 97.0], [250.0, 97.0], [75.0, 60.0], [10.0, 105.0], [150.0, 85.0]])
+    exact = CountingScore()
+    grid.exact_fn = exact
+    try:
+        scores, labels = grid.score(X)
+    finally:
+        grid.exact_fn = linear_score
+    expected, expected_labels = linear_score(X)
+    
+    assert grid.contains(X).tolist() == [True, False, False, False, True]
+    assert exact.rows == 3
+    assert np.allclose(scores, expected, atol=1e-9)
+    assert np.array_equal(labels, expected_labels)
+
+def test_without_an_exact_model_inputs_are_clamped(grid):
+    clamped = AnomalyScoreGrid(grid.scores, (30.0, 220.0), (70.0, 100.0))
+    scores, _ = clamped.score(np.array([[250.0, 60.0], [220.0, 70.0]]))
+    assert scores[0] == scores[1]
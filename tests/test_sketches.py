@@ -0,0 +1,96 @@
+import random
+import numpy as np
+import pytest
+from backend.sketches import KLLSketch, weighted_quantiles
+
+QUANTILES = [0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99]
+# About 1.7/k is expected at k=200; the margin keeps the seeded runs far from flaky
+MAX_RANK_ERROR = 0.02
+
+@pytest.fixture
+def values():
+    random.seed(7)
+    rng = np.random.default_rng(7)
+    # Heart-rate like values with many exact ties, as ingest produces
+    return np.round(rng.normal(75.0, 12.0, 100_000), 1)
+
+def _rank_errors(data, estimates):
+    ordered = np.sort(data)
+    errors = []
+    for q, estimate in zip(QUANTILES, estimates):
+        # Any rank the estimate occupies among ties counts as a hit
+        low = np.searchsorted(ordered, estimate, side='left') / len(ordered)
+        high = np.searchsorted(ordered, estimate, side='right') / len(ordered)
+        errors.append(0.0 if low <= q <= high else min(abs(q - low), abs(q - high)))
+    return errors
+
+def _fill(values, k=200, chunk=1000):
+    sketch = KLLSketch(k)
+    for start in range(0, len(values), chunk):
+        sketch.update(values[start:start + chunk])
+    return sketch
+
+def test_rank_error_against_exact_quantiles(values):
+    sketch = _fill(values)
+    count, estimates = weighted_quantiles([sketch], QUANTILES)
+    
+    assert count == len(values)
+    assert max(_rank_errors(values, estimates)) < MAX_RANK_ERROR
+    # Equivalently, each estimate lies between numpy's exact quantiles at q -/+ the allowed error
+    q = np.asarray(QUANTILES)
+    below, above = np.clip(q - MAX_RANK_ERROR, 0, 1), np.clip(q + MAX_RANK_ERROR, 0, 1)
+    assert np.all(np.quantile(values, below) <= estimates)
+    assert np.all(estimates <= np.quantile(values, above))
+
+def test_compaction_bounds_memory_and_preserves_weight(values):
+    sketch = _fill(values)
+    items, weights = sketch.weighted_items()
+    
+    assert len(items) < 3 * sketch.k
+    assert len(sketch.levels) > 1
+    assert weights.sum() == sketch.n == len(values)
+    for level, level_items in enumerate(sketch.levels[:-1]):
+        assert len(level_items) <= sketch._capacity(level)
+
+def test_merge_matches_a_single_sketch(values):
+    parts = [_fill(part) for part in np.array_split(values, 10)]
+    merged = KLLSketch(200)
+    for part in parts:
+        merged.merge(part)
+    _, weights = merged.weighted_items()
+    _, estimates = weighted_quantiles([merged], QUANTILES)
+    
+    assert merged.n == len(values)
+    assert weights.sum() == len(values)
+    assert max(_rank_errors(values, estimates)) < MAX_RANK_ERROR
+
+def test_weighted_quantiles_over_unmerged_sketches(values):
+    parts = [_fill(part) for part in np.array_split(values, 24)]
+    count, estimates = weighted_quantiles(parts, QUANTILES)
+    
+    assert count == len(values)
+    assert max(_rank_errors(values, estimates)) < MAX_RANK_ERROR
+    assert weighted_quantiles([], QUANTILES) == (0, [None] * len(QUANTILES))
+    assert weighted_quantiles([KLLSketch(200)], [0.5]) == (0, [None])
+
+def test_small_sketch_is_exact():
+    sketch = KLLSketch(200)
+    sketch.update([5.0, 1.0, 3.0, 2.0, 4.0])
+    
+    assert len(sketch.levels) == 1
+    assert weighted_quantiles([sketch], [0.0, 0.5, 1.0]) == (5, [1.0, 3.0, 5.0])
+
+@pytest.mark.parametrize("size", [0, 7, 100_000])
+def test_bytes_round_trip(values, size):
+    sketch = _fill(values[:size], k=64)
+    restored = KLLSketch.from_bytes(sketch.to_bytes())
+    
+    assert (restored.k, restored.n) == (sketch.k, sketch.n)
+    assert len(restored.levels) == len(sketch.levels)
+    for restored_items, items in zip(restored.levels, sketch.levels):
+        assert np.array_equal(restored_items, items)
+    # The restored sketch keeps working: it can take more values and be merged
+    restored.update([1.0, 2.0])
+    restored.merge(sketch)
+    assert restored.n == 2 * size + 2
+    assert restored.weighted_items()[1].sum() == restored.n